@@ -1,15 +1,41 @@
-
-
 __version__ = '0.3.5'
 
 
-from .tools import open
+from .tools import open, open_all
 
 from .core import interface_driver
 
-from . import pci2702
-from . import pci2724
-from . import pci6204
-from . import pci7204
-
+from . import backend
+
+from .registry import register_driver
+
+
+# board drivers and optional tools are imported on first access
+# (PEP 562), e.g. pyinterface.pci2724
+_lazy_modules = (
+    'pci2702',
+    'pci2724',
+    'pci6204',
+    'pci7204',
+    'aio',
+    'client',
+    'cos',
+    'metrics',
+    'replay',
+    'sampler',
+    'server',
+    'shared',
+    'simulator',
+    'trace',
+)
+
+def __getattr__(name):
+    if name in _lazy_modules:
+        import importlib
+        return importlib.import_module('.' + name, __name__)
+    msg = "module {0!r} has no attribute {1!r}".format(__name__, name)
+    raise AttributeError(msg)
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_modules))
 
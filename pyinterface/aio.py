@@ -0,0 +1,285 @@
+"""
+asyncio facade for the board drivers.
+
+async_board wraps a driver and exposes the public methods of the driver
+as coroutines; the blocking register I/O runs in an executor of the
+board (one worker per BAR by default), so the event loop never waits on
+the ports:
+
+    >>> from pyinterface import aio
+    >>> b = aio.wrap(pyinterface.open(7204, 0))
+    >>> await b.set_motion('PTP', axis=1)
+    >>> await b.start_motion('PTP', axis=1)
+    >>> await b.ppmc_wait_idle(axis=1, timeout=10)
+    >>> await b.get_counter(axis=1)
+
+Public methods are awaitable, except:
+
+- read_batch(), write_back() and snapshot(), which are returned as they
+  are: the first two are context managers for a plain `with` around
+  awaited calls, and snapshot() reads its window on the calling thread
+  for use inside read_batch()
+- locked(), which raises TypeError: the bar lock would be held by the
+  event loop thread while the awaited calls wait for it in the
+  executor. Run the whole sequence as one job instead:
+  `await b.run(func)`, with func doing its accesses inside
+  `with b.driver.locked(bar):`
+
+For the PCI-7204, a PPMC command and its data bytes run as one job in
+the executor, under the bar lock of the axis (see
+interface_driver.locked()), so no other thread can put a command in
+between; each handshake step gives up at a deadline (TimeoutError).
+ppmc_wait_idle() polls the status with asyncio.sleep() without holding
+the lock.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import time
+
+from .core import flagged_bytes
+
+
+class async_board(object):
+    """Awaitable wrapper of a board driver.
+
+    Parameters
+    ----------
+    driver : interface_driver
+    executor : concurrent.futures.Executor, optional
+        Executor for the blocking calls. By default the board gets its own
+        thread pool with one worker per BAR, which is shut down by close().
+    """
+
+    def __init__(self, driver, executor=None):
+        self.driver = driver
+        self._own_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max(len(driver.bar), 1),
+                thread_name_prefix='pyinterface-{0}'.format(type(driver).__name__))
+            pass
+        self.executor = executor
+        pass
+
+    def __repr__(self):
+        return '<async_board {0}>'.format(self.driver)
+
+    # context managers and window APIs of the driver, not wrapped
+    passthrough = ('read_batch', 'write_back', 'snapshot')
+
+    def __getattr__(self, name):
+        if name == 'locked':
+            msg = 'locked() cannot be used through async_board; run the '
+            msg += 'locked sequence as one job with run()'
+            raise TypeError(msg)
+        attr = getattr(self.driver, name)
+        if name.startswith('_') or not callable(attr) \
+                or name in self.passthrough:
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        # cache the wrapper; later lookups do not reach __getattr__
+        self.__dict__[name] = method
+        return method
+
+    async def run(self, func, *args, **kwargs):
+        """Run the blocking `func(*args, **kwargs)` in the executor."""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    def close(self):
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
+            pass
+        return
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+        return
+
+
+class async_pci7204(async_board):
+    """async_board of pci7204_driver with deadline-bounded PPMC handshakes."""
+
+    # [s] between two polls of a PPMC status register
+    poll_interval = 0.001
+
+    def _poll_status(self, axis, mask, value, timeout, msg):
+        # blocking; poll until (status & mask) == value, or raise at the
+        # deadline
+        read_status = self.driver.ppmc_read_status_raw
+        deadline = time.monotonic() + timeout
+        while read_status(axis) & mask != value:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(msg)
+            time.sleep(self.poll_interval)
+            continue
+        return
+
+    def _transaction(self, cmd, axis, data, nread, timeout):
+        # runs in the executor, holding the bar lock of the axis from the
+        # command to the last data byte
+        from .pci7204 import ppmc_status_obf, ppmc_status_ibf, ppmc_status_ist
+
+        driver = self.driver
+        driver._verify_axis_num(axis)
+        ret = bytearray()
+        with driver.locked(axis):
+            if cmd is not None:
+                self._poll_status(axis, ppmc_status_ibf | ppmc_status_ist, 0,
+                                  timeout, 'PPMC command register is busy')
+                driver.write(axis, 0x01, bytes([cmd]))
+                pass
+            for d in data:
+                self._poll_status(axis, ppmc_status_ibf, 0, timeout,
+                                  'PPMC data register is busy')
+                driver.write(axis, 0x00, bytes([d]))
+                continue
+            for i in range(nread):
+                self._poll_status(axis, ppmc_status_obf, ppmc_status_obf,
+                                  timeout, 'PPMC data register is busy')
+                ret.append(driver.read_u8(axis, 0x00))
+                continue
+            pass
+        return bytes(ret)
+
+    async def _wait_status(self, axis, mask, value, timeout, msg):
+        # poll until (status & mask) == value, or raise at the deadline
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        read_status = self.driver.ppmc_read_status_raw
+        while True:
+            if (await self.run(read_status, axis)) & mask == value:
+                return
+            if loop.time() >= deadline:
+                raise TimeoutError(msg)
+            await asyncio.sleep(self.poll_interval)
+            continue
+
+    def _to_flagged(self, d, axis, flags=None, flag_map=None):
+        if flags is None:
+            flags, flag_map = self.driver._get_flag_slice('in', axis, 0x00, 1)
+            pass
+        return flagged_bytes(d, flags, flag_map=flag_map)
+
+    async def ppmc_transaction(self, cmd, axis=1, data=b'', nread=0,
+                               timeout=0.5):
+        """Send PPMC command `cmd` followed by the `data` bytes, then read
+        `nread` data bytes, as one job under the bar lock of `axis`.
+
+        Parameters
+        ----------
+        cmd : int or None
+            None sends no command (data bytes only).
+        timeout : float
+            [s] for each handshake step.
+
+        Returns
+        -------
+        bytes
+            The bytes read.
+        """
+        return await self.run(self._transaction, cmd, axis, bytes(data),
+                              nread, timeout)
+
+    async def ppmc_read_data(self, axis=1, timeout=0.5):
+        d = await self.ppmc_transaction(None, axis, nread=1, timeout=timeout)
+        return self._to_flagged(d, axis)
+
+    async def ppmc_read_data_raw(self, axis=1, timeout=0.5):
+        d = await self.ppmc_transaction(None, axis, nread=1, timeout=timeout)
+        return d[0]
+
+    async def ppmc_write_data(self, data, axis=1, timeout=0.5):
+        if isinstance(data, int):
+            data = data.to_bytes(1, 'little')
+            pass
+        await self.ppmc_transaction(None, axis, data=data, timeout=timeout)
+        return
+
+    async def ppmc_write_command(self, data, axis=1, timeout=0.5):
+        if not isinstance(data, int):
+            data = data[0]
+            pass
+        await self.ppmc_transaction(data, axis, timeout=timeout)
+        return
+
+    async def _read_flags(self, cmd, axis, flags=None, flag_map=None):
+        d = await self.ppmc_transaction(cmd, axis, nread=1)
+        return self._to_flagged(d, axis, flags, flag_map)
+
+    async def ppmc_get_stop_status(self, axis=1):
+        return await self._read_flags(0b01000000, axis)
+
+    async def ppmc_get_error(self, axis=1):
+        return await self._read_flags(0b01000001, axis)
+
+    async def ppmc_get_counter(self, axis=1):
+        d = await self.ppmc_transaction(0b01000010, axis, nread=3)
+        return int.from_bytes(d, 'little')
+
+    async def ppmc_set_counter(self, count, axis=1):
+        d = (count & 0xffffff).to_bytes(3, 'little')
+        await self.ppmc_transaction(0b01000011, axis, data=d)
+        return
+
+    async def ppmc_get_limit_status(self, axis=1):
+        from .pci7204 import ppmc_limit_flags, ppmc_limit_map
+        return await self._read_flags(0b01000110, axis,
+                                      ppmc_limit_flags, ppmc_limit_map)
+
+    async def ppmc_get_aux_in(self, axis=1):
+        return await self._read_flags(0b01000100, axis)
+
+    async def ppmc_set_aux_out(self, data, axis=1):
+        if isinstance(data, int):
+            data = data.to_bytes(1, 'little')
+            pass
+        await self.ppmc_transaction(0b01000101, axis, data=data)
+        return
+
+    async def ppmc_get_input_status(self, axis=1):
+        return await self._read_flags(0b01000110, axis)
+
+    async def ppmc_wait_idle(self, axis=1, timeout=None):
+        """Wait until the motion of `axis` has finished (BUSY is cleared).
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Deadline [s]; TimeoutError is raised when it passes. None waits
+            forever.
+        """
+        from .pci7204 import ppmc_status_busy
+
+        if timeout is None:
+            timeout = float('inf')
+            pass
+        await self._wait_status(axis, ppmc_status_busy, 0, timeout,
+                                'PPMC is still busy')
+        return
+
+
+# '<module>.<class>' of a driver class -> facade class; names, so that
+# the driver modules are not imported by this module
+facades = {
+    'pyinterface.pci7204.pci7204_driver': async_pci7204,
+}
+
+def wrap(driver, executor=None):
+    """Return the asyncio facade of `driver`."""
+    for cls in type(driver).__mro__:
+        facade = facades.get('{0}.{1}'.format(cls.__module__, cls.__qualname__))
+        if facade is not None:
+            return facade(driver, executor)
+        continue
+    return async_board(driver, executor)
@@ -0,0 +1,84 @@
+"""
+Register I/O backends.
+
+interface_driver does not talk to the ports directly; every register
+access goes through a backend object. A backend provides:
+
+- read(bar, offset, size) -> bytes
+- write(bar, offset, data)
+- read_into(bar, offset, buf)
+- write_many(bar, chunks)  (chunks: iterable of (offset, data))
+- lspci(vendor_id, device_id) -> list of pci configs
+- bar_lock(bar) -> the lock of the bar used by interface_driver.locked()
+
+`bar` is one of the objects in `pci_config.bar` returned by lspci().
+A backend sets thread_safe = False if accesses from several threads must
+not be interleaved (e.g. a recorded session that is replayed in order).
+A backend that keeps the output registers itself sets keeps_outputs =
+True and provides modify(bar, offset, clear, xor) -> bytes, which writes
+(current & ~clear) ^ xor and returns the new value; read-modify-writes
+of the drivers then use it instead of the private log_bytes_out.
+pypci_backend (real boards) is used unless another backend is given to
+the driver or set with set_default_backend().
+"""
+
+import threading
+
+
+class backend(object):
+    thread_safe = True
+    keeps_outputs = False
+
+    def read(self, bar, offset, size):
+        raise NotImplementedError
+
+    def write(self, bar, offset, data):
+        raise NotImplementedError
+
+    def read_into(self, bar, offset, buf):
+        buf[:] = self.read(bar, offset, len(buf))
+        return
+
+    def write_many(self, bar, chunks):
+        for offset, data in chunks:
+            self.write(bar, offset, data)
+            continue
+        return
+
+    def modify(self, bar, offset, clear, xor):
+        raise NotImplementedError
+
+    def bar_lock(self, bar):
+        return threading.RLock()
+
+    def lspci(self, vendor_id, device_id):
+        raise NotImplementedError
+
+
+class pypci_backend(backend):
+    def __init__(self):
+        import pypci
+        self.pypci = pypci
+
+        # bind the port accessors directly; no extra call layer
+        self.read = pypci.read
+        self.write = pypci.write
+        pass
+
+    def lspci(self, vendor_id, device_id):
+        return self.pypci.lspci(vendor_id, device_id)
+
+
+_default_backend = None
+
+def get_default_backend():
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = pypci_backend()
+        pass
+    return _default_backend
+
+def set_default_backend(b):
+    global _default_backend
+    _default_backend = b
+    return
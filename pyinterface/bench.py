@@ -0,0 +1,201 @@
+"""
+Benchmarks for pyinterface.
+
+Run from the command line:
+
+    $ python -m pyinterface.bench import
+    $ python -m pyinterface.bench threads
+    $ python -m pyinterface.bench server
+"""
+
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+# statement -> description
+import_cases = (
+    ('import pyinterface', 'package only'),
+    ('import pyinterface; pyinterface.pci2724', 'package + one driver'),
+    ('import pyinterface; [getattr(pyinterface, m) for m in '
+     '("pci2702", "pci2724", "pci6204", "pci7204")]', 'package + all drivers'),
+)
+
+
+def import_time(statement='import pyinterface', repeat=10):
+    """Measure the time [s] to run `statement` in fresh interpreters.
+
+    Returns the median of `repeat` runs. Interpreter start-up is not
+    included.
+    """
+    code = ('import time; t0 = time.perf_counter(); {0}; '
+            'print(time.perf_counter() - t0)').format(statement)
+
+    times = []
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code])
+        times.append(float(out))
+        continue
+    return statistics.median(times)
+
+
+def bench_import(repeat=10):
+    for statement, desc in import_cases:
+        t = import_time(statement, repeat)
+        print('{0:24s} {1:8.2f} ms'.format(desc, t * 1e3))
+        continue
+    return
+
+
+def _hammer(board, bar_num, offset, n, barrier):
+    barrier.wait()
+    for i in range(n):
+        board.write_u8(bar_num, offset, i)
+        board.read_u8(bar_num, offset)
+        continue
+    return
+
+def thread_throughput(threads, bars=(1,), ops=20000):
+    """Measure register accesses [1/s] of `threads` threads sharing one
+    simulated PCI-7204; thread i writes and reads bar bars[i % len(bars)].
+    """
+    from .simulator import simulated_backend, sim_pci7204
+    from .pci7204 import pci7204_driver
+
+    sim = simulated_backend()
+    board = pci7204_driver(sim.add_board(sim_pci7204()).config, sim)
+
+    barrier = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=_hammer,
+                                args=(board, bars[i % len(bars)], 0x08,
+                                      ops, barrier))
+               for i in range(threads)]
+    for w in workers:
+        w.start()
+        continue
+
+    barrier.wait()
+    t0 = time.perf_counter()
+    for w in workers:
+        w.join()
+        continue
+    dt = time.perf_counter() - t0
+    return 2 * ops * threads / dt
+
+def bench_threads(ops=20000):
+    print('threads   one bar [acc/s]   two bars [acc/s]')
+    for n in (1, 2, 4, 8):
+        same = thread_throughput(n, (1,), ops)
+        split = thread_throughput(n, (1, 2), ops)
+        print('{0:7d} {1:17.0f} {2:18.0f}'.format(n, same, split))
+        continue
+    return
+
+
+def _client(path, n, barrier):
+    from .client import remote_backend
+    from .tools import open
+
+    b = open(2724, 0, backend=remote_backend(path))
+    barrier.wait()
+    for i in range(n):
+        b.input_dword_raw()
+        continue
+    return
+
+def server_throughput(clients, reads=2000, tick=0.0):
+    """Measure requests [1/s] served to `clients` client processes reading
+    the inputs of a simulated PCI-2724 through a board server.
+
+    Returns (requests/s, hardware reads, merged reads).
+    """
+    import asyncio
+    from .server import board_server
+    from .simulator import simulated_backend, sim_pci2724
+    from .tools import open
+
+    sim = simulated_backend()
+    sim.add_board(sim_pci2724())
+    path = os.path.join(tempfile.mkdtemp(), 'bench.sock')
+    server = board_server([open(2724, 0, backend=sim)], path, tick)
+
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    async def serve():
+        await server.start()
+        ready.set()
+        while server._server is not None:
+            await asyncio.sleep(0.05)
+            continue
+        return
+
+    t = threading.Thread(target=loop.run_until_complete, args=(serve(),))
+    t.start()
+    ready.wait()
+
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(clients + 1)
+    procs = [ctx.Process(target=_client, args=(path, reads, barrier))
+             for i in range(clients)]
+    for p in procs:
+        p.start()
+        continue
+
+    barrier.wait()
+    hw0 = server.hw_reads
+    merged0 = server.merged_reads
+    t0 = time.perf_counter()
+    for p in procs:
+        p.join()
+        continue
+    dt = time.perf_counter() - t0
+
+    ret = (clients * reads / dt, server.hw_reads - hw0,
+           server.merged_reads - merged0)
+    loop.call_soon_threadsafe(server.close)
+    t.join()
+    loop.close()
+    os.rmdir(os.path.dirname(path))
+    return ret
+
+def bench_server(reads=2000):
+    print('clients   requests/s   hw reads   merged')
+    for n in (1, 2, 4, 8):
+        rate, hw, merged = server_throughput(n, reads)
+        print('{0:7d} {1:12.0f} {2:10d} {3:8d}'.format(n, rate, hw, merged))
+        continue
+    return
+
+
+benchmarks = {
+    'import': bench_import,
+    'server': bench_server,
+    'threads': bench_threads,
+}
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+        pass
+
+    names = argv or sorted(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            msg = 'unknown benchmark {0!r}, choose from {1}'.format(
+                name, ', '.join(sorted(benchmarks)))
+            raise SystemExit(msg)
+        print('# {0}'.format(name))
+        benchmarks[name]()
+        continue
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Client of pyinterface-server (see pyinterface.server).
+
+remote_backend sends the register accesses of the drivers to the server,
+so drivers run unchanged in processes without access to the ports:
+
+    >>> from pyinterface import client
+    >>> rb = client.remote_backend('/run/pyinterface/pyinterface.sock')
+    >>> b = pyinterface.open(2724, 0, backend=rb)
+    >>> b.input_dword_raw()
+
+The output registers are kept by the server: read-modify-writes of the
+drivers (e.g. output_point, set_bits) are sent as MODIFY requests and
+applied by the server, so clients sharing output ports do not overwrite
+each other. Multi-step sequences of the drivers (interface_driver.locked(),
+e.g. a PPMC command and its data bytes) lock the bar on the server, so
+the accesses of other clients wait until the sequence is done.
+"""
+
+import socket
+import struct
+import threading
+
+from .backend import backend
+
+
+# protocol (see pyinterface.server)
+LSPCI = 0
+READ = 1
+WRITE = 2
+LOCK = 3
+UNLOCK = 4
+MODIFY = 5
+
+OK = 0
+ERROR = 1
+
+request = struct.Struct('<BBBHH')
+reply = struct.Struct('<BH')
+
+# in a directory only the server's user can write to, so that no other
+# user can bind the path before the server (see board_server.start())
+default_socket = '/run/pyinterface/pyinterface.sock'
+
+
+class RemoteAccessError(Exception):
+    pass
+
+
+class remote_bar(object):
+    def __init__(self, board, index, size):
+        self.board = board
+        self.index = index
+        self.size = size
+        pass
+
+    def __repr__(self):
+        return '<remote_bar board={0} bar={1}>'.format(self.board, self.index)
+
+
+class remote_lock(object):
+    """Bar lock of a remote_backend.
+
+    Single register accesses are atomic on the server, so the outermost
+    acquire only takes a local lock. When the lock is taken again while
+    held, i.e. by an access inside a locked() sequence, the bar is also
+    locked on the server until the outermost release.
+    """
+
+    def __init__(self, backend, bar):
+        self.backend = backend
+        self.bar = bar
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._remote = False
+        pass
+
+    def acquire(self):
+        self._lock.acquire()
+        self._depth += 1
+        if (self._depth > 1) and not self._remote:
+            try:
+                self.backend.lock(self.bar)
+            except BaseException:
+                self._depth -= 1
+                self._lock.release()
+                raise
+            self._remote = True
+            pass
+        return True
+
+    def release(self):
+        self._depth -= 1
+        try:
+            if (self._depth == 0) and self._remote:
+                self._remote = False
+                self.backend.unlock(self.bar)
+                pass
+        finally:
+            self._lock.release()
+            pass
+        return
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+        return
+
+
+class remote_config(object):
+    def __init__(self, vendor_id, device_id, board, bar_sizes):
+        self.vendor_id = vendor_id
+        self.device_id = device_id
+        self.board = board
+        self.bar = [remote_bar(board, i, size)
+                    for i, size in enumerate(bar_sizes)]
+        pass
+
+
+class remote_backend(backend):
+    """Backend forwarding register accesses to a board server.
+
+    One connection is shared by all threads; requests are serialized.
+    """
+    keeps_outputs = True
+
+    def __init__(self, path=default_socket):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self._file = self.sock.makefile('rb')
+        self._lock = threading.Lock()
+        pass
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+        return
+
+    def _request(self, op, board, bar_num, offset, size, data=b''):
+        msg = request.pack(op, board, bar_num, offset, size) + data
+        with self._lock:
+            self.sock.sendall(msg)
+            head = self._file.read(reply.size)
+            if len(head) != reply.size:
+                raise RemoteAccessError('connection closed by the server')
+            status, length = reply.unpack(head)
+            payload = self._file.read(length)
+            pass
+
+        if status != OK:
+            raise RemoteAccessError(payload.decode(errors='replace'))
+        return payload
+
+    def lspci(self, vendor_id, device_id):
+        d = self._request(LSPCI, 0, 0, vendor_id, device_id)
+        ret = []
+        pos = 1
+        for i in range(d[0]):
+            board, nbars = d[pos], d[pos+1]
+            pos += 2
+            sizes = struct.unpack_from('<{0}H'.format(nbars), d, pos)
+            pos += 2 * nbars
+            ret.append(remote_config(vendor_id, device_id, board, sizes))
+            continue
+        return ret
+
+    def read(self, bar, offset, size):
+        return self._request(READ, bar.board, bar.index, offset, size)
+
+    def write(self, bar, offset, data):
+        data = bytes(data)
+        self._request(WRITE, bar.board, bar.index, offset, len(data), data)
+        return
+
+    def modify(self, bar, offset, clear, xor):
+        data = bytes(clear) + bytes(xor)
+        return self._request(MODIFY, bar.board, bar.index, offset,
+                             len(clear), data)
+
+    def lock(self, bar):
+        self._request(LOCK, bar.board, bar.index, 0, 0)
+        return
+
+    def unlock(self, bar):
+        self._request(UNLOCK, bar.board, bar.index, 0, 0)
+        return
+
+    def bar_lock(self, bar):
+        return remote_lock(self, bar)
@@ -1,98 +1,1187 @@
 
+import contextlib
+import functools
 import struct
-import pypci
+import time
+
+from .backend import get_default_backend
 
 
 # functions
 # ---------
 
+# LSB-first lookup tables for the bit codec (index = byte value)
+_bit_str_table = tuple(format(i, '08b')[::-1] for i in range(256))
+_bit_list_table = tuple(tuple((i >> j) & 1 for j in range(8)) for i in range(256))
+_bit_list_index = {bytes(bits): i for i, bits in enumerate(_bit_list_table)}
+_byte_table = tuple(bytes([i]) for i in range(256))
+_ascii_bit_table = bytes.maketrans(b'01', b'\x00\x01')
+_ones = b'\x01' * 256
+_monotonic_ns = time.monotonic_ns
+
+# numpy is optional and imported on first use (see _get_numpy)
+numpy = None
+
+
 def bytes2bit(bytes_data):
-    return ''.join([format(byte, '08b')[::-1] for byte in bytes_data])
+    return ''.join([_bit_str_table[byte] for byte in bytes_data])
 
 def bit2bytes(bit_str):
-    bit_str += ('0' * ((8 - len(bit_str)) % 8))
-    d = b''
-    for i in range(int(len(bit_str)/8)):
-        bb = bit_str[8*i:8*(i+1)]
-        d += int(bb[::-1], 2).to_bytes(1, 'little')
-        continue
-    return  d
+    size = (len(bit_str) + 7) // 8
+    if size == 0:
+        return b''
+    return int(bit_str[::-1], 2).to_bytes(size, 'little')
 
 def bytes2list(bytes_data):
-    return list(map(int, bytes2bit(bytes_data)))
+    return [bit for byte in bytes_data for bit in _bit_list_table[byte]]
 
 def list2bytes(bit_list):
-    bit_str = ''.join(map(str, bit_list))
-    return bit2bytes(bit_str)
+    # as str() of each item, like the original ''.join(map(str, ...)):
+    # 0 / 1 and '0' / '1' are accepted, True or 1.0 are not
+    items = [str(bit) for bit in bit_list]
+    bit_str = ''.join(items)
+    if len(bit_str) != len(items) or bit_str.strip('01'):
+        msg = 'bit_list items must be 0 or 1: {0!r}'.format(bit_list)
+        raise ValueError(msg)
+    bits = bit_str.encode().translate(_ascii_bit_table)
+    bits += bytes((8 - len(bits)) % 8)
+    return bytes([_bit_list_index[bits[i:i+8]] for i in range(0, len(bits), 8)])
+
+def bytes2int(bytes_data, signed=False):
+    return int.from_bytes(bytes_data, 'little', signed=signed)
+
+def int2bytes(value, size, signed=False):
+    return value.to_bytes(size, 'little', signed=signed)
+
+def compile_flags(bit_flags):
+    """Compile a bit_flags table into per-register name indexes.
+    
+    Returns a nested tuple indexed as [bar][offset], whose items are dicts
+    mapping flag name to (bar, offset, bit, mask). `bit` is the first bit
+    position of the name in the register, and `mask` covers every bit of
+    the register carrying that name.
+    """
+    index = []
+    for bar_num, bar_flags in enumerate(bit_flags):
+        bar_index = []
+        for offset, names in enumerate(bar_flags):
+            reg_index = {}
+            for bit, name in enumerate(names):
+                if name == '':
+                    continue
+                if name in reg_index:
+                    _, _, first, mask = reg_index[name]
+                    reg_index[name] = (bar_num, offset, first, mask | (1 << bit))
+                else:
+                    reg_index[name] = (bar_num, offset, bit, 1 << bit)
+                    pass
+                continue
+            bar_index.append(reg_index)
+            continue
+        index.append(tuple(bar_index))
+        continue
+    return tuple(index)
+
+def compile_flag_map(bit_flag):
+    """Map flag names of a bit_flag slice to (byte index, bit) of their
+    first occurrence."""
+    flag_map = {}
+    for i, names in enumerate(bit_flag):
+        for bit, name in enumerate(names):
+            if name != '' and name not in flag_map:
+                flag_map[name] = (i, bit)
+                pass
+            continue
+        continue
+    return flag_map
+
+def compile_point_masks(io_number):
+    """Map (start, num) of DIO points (1-origin) to the int bit mask of
+    points start .. start+num-1 (point 1 = bit0)."""
+    return {(start, num): ((1 << num) - 1) << (start - 1)
+            for start in range(1, io_number + 2)
+            for num in range(0, io_number + 2 - start)}
+
+def compile_channel_plan(flag_index, names):
+    """Group channel names by register for batch I/O.
+    
+    Parameters
+    ----------
+    flag_index : flag_index_in or flag_index_out of a driver class
+    names : sequence of str
+    
+    Returns
+    -------
+    tuple
+        Runs of adjacent registers as (bar, offset, size, items), where
+        `items` lists (name, byte index in the run, bit, mask) of the
+        channels in the run. Each run is read or written in one access.
+    """
+    located = {}
+    for bar_num, bar_index in enumerate(flag_index):
+        for reg_index in bar_index:
+            for name, item in reg_index.items():
+                located.setdefault(name, []).append(item)
+                continue
+            continue
+        continue
+    
+    regs = {}
+    for name in names:
+        items = located.get(name)
+        if items is None:
+            raise UnknownChannelError('unknown channel {0!r}'.format(name))
+        if len(items) > 1:
+            msg = 'channel {0!r} is in several registers'.format(name)
+            raise UnknownChannelError(msg)
+        bar_num, offset, bit, mask = items[0]
+        regs.setdefault((bar_num, offset), []).append((name, bit, mask))
+        continue
+    
+    runs = []
+    for bar_num, offset in sorted(regs):
+        if runs and (runs[-1][0] == bar_num) \
+           and (runs[-1][1] + runs[-1][2] == offset):
+            run = runs[-1]
+            run[2] += 1
+        else:
+            run = [bar_num, offset, 1, []]
+            runs.append(run)
+            pass
+        i = offset - run[1]
+        run[3].extend((name, i, bit, mask)
+                      for name, bit, mask in regs[(bar_num, offset)])
+        continue
+    return tuple((b, o, n, tuple(items)) for b, o, n, items in runs)
+
+@functools.lru_cache(maxsize=256)
+def _cached_channel_plan(cls, in_out, names):
+    if in_out == 'in':
+        return compile_channel_plan(cls.flag_index_in, names)
+    
+    # output runs get the bits to clear before the channels are applied:
+    # registers with write side effects (commands) start from 0, as in
+    # set_flag(), instead of repeating the last command in log_bytes_out
+    wt = cls._write_through_set
+    return tuple((bar_num, offset, size, items,
+                  bytes([0xff if (bar_num, offset + i) in wt else 0
+                         for i in range(size)]))
+                 for bar_num, offset, size, items
+                 in compile_channel_plan(cls.flag_index_out, names))
+
+_flag_map_cache = {}
+
+def _cached_flag_map(bit_flag):
+    key = tuple(map(tuple, bit_flag))
+    flag_map = _flag_map_cache.get(key)
+    if flag_map is None:
+        flag_map = compile_flag_map(key)
+        _flag_map_cache[key] = flag_map
+        pass
+    return flag_map
+
+def _get_numpy(caller):
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('{0} requires numpy'.format(caller))
+        pass
+    return numpy
+
+def bytes2array(bytes_data):
+    """Unpack a bulk buffer into a LSB-first numpy array of bits (uint8)."""
+    np = _get_numpy('bytes2array')
+    buf = np.frombuffer(bytes_data, dtype=np.uint8)
+    return np.unpackbits(buf, bitorder='little')
+
+def array2bytes(bit_array):
+    """Pack a LSB-first array of bits into bytes (inverse of bytes2array)."""
+    np = _get_numpy('array2bytes')
+    bits = np.asarray(bit_array, dtype=np.uint8)
+    return np.packbits(bits, bitorder='little').tobytes()
+
+
+_int_structs = {1: struct.Struct('<b'), 2: struct.Struct('<h'),
+                4: struct.Struct('<i'), 8: struct.Struct('<q')}
+_uint_structs = {1: struct.Struct('<B'), 2: struct.Struct('<H'),
+                 4: struct.Struct('<I'), 8: struct.Struct('<Q')}
+_float_structs = {2: struct.Struct('<e'), 4: struct.Struct('<f'),
+                  8: struct.Struct('<d')}
+_fmt_structs = {}
+
+def _get_struct(fmt):
+    s = _fmt_structs.get(fmt)
+    if s is None:
+        s = struct.Struct(fmt)
+        _fmt_structs[fmt] = s
+        pass
+    return s
 
 
 # class
 # -----
 
+class UnknownChannelError(Exception):
+    pass
+
+class TimerNotConfiguredError(Exception):
+    pass
+
+class InvalidTimerIntervalError(Exception):
+    pass
+
+
 class interface_driver(object):
     config = None
+    backend = None
     board_id = -1
     
     bar = []
+    board_id_register = None
     bit_flags_in = ()
     bit_flags_out = ()
+    flag_index_in = ()
+    flag_index_out = ()
     log_bytes_in = []
     log_bytes_out = []
     
-    def __init__(self, pci_config):
+    # (bar, offset) of registers with write side effects (commands, data
+    # ports, ...). They are always written through, even in write-back mode.
+    write_through = ()
+    
+    # (bar, start, end) register windows without read side effects, which
+    # read_batch() snapshots by default
+    batch_windows = ()
+    
+    # (bar, offset) of configuration registers for which re-writing the
+    # current value has no effect; candidates for write elision
+    idempotent_registers = ()
+    
+    elided_writes = 0
+    
+    # (bar, offset) of the interval timer control register (TCTRL / SCK
+    # fields) and of its status register (SIGT), for boards with a timer;
+    # the timer is used only after configure_timer()
+    timer_control_register = None
+    timer_status_register = None
+    
+    # [s] before an expected tick at which wait_timer_tick() stops
+    # sleeping and starts polling, and [s] between two polls
+    timer_spin = 200e-6
+    timer_poll_interval = 20e-6
+    
+    _flag_slices = {}
+    _write_through_set = frozenset()
+    _idempotent_set = frozenset()
+    _elide_writes = False
+    _out_known = []
+    _write_back_mode = False
+    _dirty = []
+    _batch = None
+    _windows = {}
+    _observers = ()
+    _metrics = None
+    _locks = ()
+    _shared = None
+    _timer = None
+    tracer = None
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.flag_index_in = compile_flags(cls.bit_flags_in)
+        cls.flag_index_out = compile_flags(cls.bit_flags_out)
+        cls._write_through_set = frozenset(cls.write_through)
+        cls._idempotent_set = frozenset(cls.idempotent_registers)
+        cls._flag_slices = {}
+        pass
+    
+    def __init__(self, pci_config, backend=None):
+        if backend is None:
+            backend = get_default_backend()
+            pass
+        
         self.config = pci_config
+        self.backend = backend
         self.bar = pci_config.bar
         self.log_bytes_in = [bytearray(bytes(_.size)) for _ in self.bar]
         self.log_bytes_out = [bytearray(bytes(_.size)) for _ in self.bar]
+        self._dirty = [set() for _ in self.bar]
+        self._windows = {}
+        self._out_known = [bytearray(_.size) for _ in self.bar]
+        self._locks = [backend.bar_lock(_) for _ in self.bar]
         self.board_id = self.get_board_id()
         pass
     
     def read(self, bar_num, offset, size):
-        bar = self.bar[bar_num]
-        ret = pypci.read(bar, offset, size)
-        self.log_bytes_in[bar_num][offset:offset+size] = ret
-        flag = self.bit_flags_in[bar_num][offset:offset+size]
-        fb = flagged_bytes(ret, flag)
+        ret = self._read_raw(bar_num, offset, size)
+        flag, flag_map = self._get_flag_slice('in', bar_num, offset, size)
+        fb = flagged_bytes(ret, flag, flag_map=flag_map)
         return fb
     
     def write(self, bar_num, offset, data):
+        with self._locks[bar_num]:
+            if self._write_back_mode and self._is_write_through(bar_num, offset,
+                                                                len(data)):
+                # keep the program order of pending writes to this bar;
+                # only the lock of this bar is taken, so that locked()
+                # sequences on different bars cannot deadlock
+                self._flush_bar(bar_num, self._dirty[bar_num])
+                pass
+            
+            # behind a backend keeping the outputs (e.g. a board server),
+            # log_bytes_out is stale once another client writes
+            if self._elide_writes and not self.backend.keeps_outputs:
+                if self._is_redundant(bar_num, offset, data):
+                    self.elided_writes += 1
+                    return
+                
+                size = len(data)
+                self._out_known[bar_num][offset:offset+size] = _ones[:size]
+                pass
+            
+            if self._batch is not None:
+                self._invalidate_batch(bar_num)
+                pass
+            
+            if self._write_back_mode:
+                if not self._is_write_through(bar_num, offset, len(data)):
+                    self._stage_write(bar_num, offset, data)
+                    return
+                pass
+            
+            self._write_raw(bar_num, offset, data)
+            pass
+        return
+    
+    def _write_raw(self, bar_num, offset, data):
         size = len(data)
         bar = self.bar[bar_num]
-        pypci.write(bar, offset, data)
+        
+        observers = self._observers
+        if observers:
+            t0 = _monotonic_ns()
+            self.backend.write(bar, offset, data)
+            dt = _monotonic_ns() - t0
+            for o in observers:
+                o.record(1, bar_num, offset, data, t0, dt)
+                continue
+        else:
+            self.backend.write(bar, offset, data)
+            pass
+        
         self.log_bytes_out[bar_num][offset:offset+size] = data
         return
     
-    def set_flag(self, bar_num, offset, flag):
-        bar = self.bar[bar_num]
-        flag_list = self.bit_flags_out[bar_num][offset]
-        flags = flag.split()
+    def _read_raw(self, bar_num, offset, size):
+        with self._locks[bar_num]:
+            if self._write_back_mode:
+                self._flush_bar(bar_num, self._dirty[bar_num])
+                pass
+            
+            if self._batch is not None:
+                ret = self._read_from_batch(bar_num, offset, size)
+                if ret is not None:
+                    return ret
+                pass
+            
+            bar = self.bar[bar_num]
+            
+            observers = self._observers
+            if observers:
+                t0 = _monotonic_ns()
+                ret = self.backend.read(bar, offset, size)
+                dt = _monotonic_ns() - t0
+                for o in observers:
+                    o.record(0, bar_num, offset, ret, t0, dt)
+                    continue
+            else:
+                ret = self.backend.read(bar, offset, size)
+                pass
+            
+            self.log_bytes_in[bar_num][offset:offset+size] = ret
+            pass
+        return ret
+    
+    def modify(self, bar_num, offset, clear, xor):
+        """Read-modify-write registers: new = (current & ~clear) ^ xor.
+        
+        The current value is taken from log_bytes_out under the bar lock,
+        or, when the backend keeps the output registers itself
+        (backend.keeps_outputs, e.g. client.remote_backend), the backend
+        applies the change, so that other users of the board are not
+        overwritten.
+        
+        Parameters
+        ----------
+        clear, xor : bytes-like
+            Bit masks of the same length, one byte per register.
+        
+        Returns
+        -------
+        bytes
+            The new value of the registers.
+        """
+        size = len(clear)
+        with self._locks[bar_num]:
+            if self.backend.keeps_outputs and not self._write_back_mode:
+                if self._batch is not None:
+                    self._invalidate_batch(bar_num)
+                    pass
+                
+                bar = self.bar[bar_num]
+                observers = self._observers
+                if observers:
+                    t0 = _monotonic_ns()
+                    new = self.backend.modify(bar, offset, clear, xor)
+                    dt = _monotonic_ns() - t0
+                    for o in observers:
+                        o.record(1, bar_num, offset, new, t0, dt)
+                        continue
+                else:
+                    new = self.backend.modify(bar, offset, clear, xor)
+                    pass
+                
+                self.log_bytes_out[bar_num][offset:offset+size] = new
+                return new
+            
+            cur = self.log_bytes_out[bar_num][offset:offset+size]
+            new = bytes([((c & ~m) ^ x) & 0xff
+                         for c, m, x in zip(cur, clear, xor)])
+            self.write(bar_num, offset, new)
+            pass
+        return new
+    
+    def read_u8(self, bar_num, offset):
+        return self._read_raw(bar_num, offset, 1)[0]
+    
+    def read_u16(self, bar_num, offset):
+        return _uint_structs[2].unpack(self._read_raw(bar_num, offset, 2))[0]
+    
+    def read_u32(self, bar_num, offset):
+        return _uint_structs[4].unpack(self._read_raw(bar_num, offset, 4))[0]
+    
+    def read_u64(self, bar_num, offset):
+        return _uint_structs[8].unpack(self._read_raw(bar_num, offset, 8))[0]
+    
+    def write_u8(self, bar_num, offset, value):
+        self.write(bar_num, offset, _byte_table[value & 0xff])
+        return
+    
+    def write_u16(self, bar_num, offset, value):
+        self.write(bar_num, offset, _uint_structs[2].pack(value & 0xffff))
+        return
+    
+    def write_u32(self, bar_num, offset, value):
+        self.write(bar_num, offset, _uint_structs[4].pack(value & 0xffffffff))
+        return
+    
+    def write_u64(self, bar_num, offset, value):
+        self.write(bar_num, offset,
+                   _uint_structs[8].pack(value & 0xffffffffffffffff))
+        return
+    
+    def _is_redundant(self, bar_num, offset, data):
+        size = len(data)
+        idem = self._idempotent_set
+        for o in range(offset, offset+size):
+            if (bar_num, o) not in idem:
+                return False
+            continue
+        
+        if _ones[:size] != self._out_known[bar_num][offset:offset+size]:
+            return False
+        return self.log_bytes_out[bar_num][offset:offset+size] == data
+    
+    def enable_write_elision(self):
+        """Skip writes that would not change an idempotent register.
+        
+        A write is skipped when every byte belongs to
+        `idempotent_registers`, was written since elision was enabled, and
+        equals the value in log_bytes_out. Skipped writes are counted in
+        `elided_writes`.
+        
+        Nothing is skipped with a backend that keeps the output registers
+        itself (backend.keeps_outputs, e.g. client.remote_backend), since
+        other clients may have changed them.
+        """
+        self._elide_writes = True
+        return
+    
+    def disable_write_elision(self):
+        self._elide_writes = False
+        return
+    
+    def _is_write_through(self, bar_num, offset, size):
+        wt = self._write_through_set
+        for o in range(offset, offset+size):
+            if (bar_num, o) in wt:
+                return True
+            continue
+        return False
+    
+    def _stage_write(self, bar_num, offset, data):
+        size = len(data)
+        self.log_bytes_out[bar_num][offset:offset+size] = data
+        self._dirty[bar_num].update(range(offset, offset+size))
+        return
+    
+    def enable_write_back(self):
+        """Buffer register writes until flush().
+        
+        Writes update log_bytes_out and mark the bytes dirty; flush() then
+        emits the dirty bytes as the fewest contiguous writes. Registers
+        listed in `write_through` are always written immediately (after
+        flushing the pending writes of their bar), and reads flush the
+        pending writes of their bar first. Bars are independent devices,
+        so ordering is kept per bar.
+        """
+        self._write_back_mode = True
+        return
+    
+    def disable_write_back(self):
+        self.flush()
+        self._write_back_mode = False
+        return
+    
+    @contextlib.contextmanager
+    def write_back(self):
+        """Context manager enabling write-back mode; flushes at exit.
+        
+        >>> with board.write_back():
+        ...     board.initialize()
+        """
+        prev = self._write_back_mode
+        self._write_back_mode = True
+        try:
+            yield self
+        finally:
+            self.flush()
+            self._write_back_mode = prev
+            pass
+        return
+    
+    def flush(self):
+        """Write the pending writes of every bar.
+        
+        Takes the bar locks one after another; do not call it inside a
+        locked() block of another bar.
+        """
+        for bar_num, dirty in enumerate(self._dirty):
+            if not dirty:
+                continue
+            
+            with self._locks[bar_num]:
+                self._flush_bar(bar_num, dirty)
+                pass
+            continue
+        return
+    
+    def _flush_bar(self, bar_num, dirty):
+        # another thread may have flushed the bar meanwhile
+        if not dirty:
+            return
+        
+        log = self.log_bytes_out[bar_num]
+        chunks = []
+        offsets = sorted(dirty)
+        start = prev = offsets[0]
+        for o in offsets[1:]:
+            if o != prev + 1:
+                chunks.append((start, bytes(log[start:prev+1])))
+                start = o
+                pass
+            prev = o
+            continue
+        chunks.append((start, bytes(log[start:prev+1])))
+        dirty.clear()
+        
+        observers = self._observers
+        if observers:
+            t0 = _monotonic_ns()
+            self.backend.write_many(self.bar[bar_num], chunks)
+            dt = (_monotonic_ns() - t0) // len(chunks)
+            for o in observers:
+                for offset, data in chunks:
+                    o.record(1, bar_num, offset, data, t0, dt)
+                    continue
+                continue
+        else:
+            self.backend.write_many(self.bar[bar_num], chunks)
+            pass
+        return
+    
+    def _add_observer(self, observer):
+        if observer not in self._observers:
+            self._observers = self._observers + (observer,)
+            pass
+        return
+    
+    def _remove_observer(self, observer):
+        self._observers = tuple(o for o in self._observers if o is not observer)
+        return
+    
+    def enable_stats(self):
+        """Start recording per-register access metrics.
+        
+        Every hardware access is counted per (bar, offset) with its size
+        and latency (see pyinterface.metrics). When disabled, the I/O path
+        only checks an empty observer tuple.
+        """
+        if self._metrics is None:
+            from .metrics import register_metrics
+            self._metrics = register_metrics()
+            pass
+        self._add_observer(self._metrics)
+        return
+    
+    def disable_stats(self):
+        """Stop recording; collected metrics are kept."""
+        if self._metrics is not None:
+            self._remove_observer(self._metrics)
+            pass
+        return
+    
+    def stats(self):
+        """Return collected metrics as {(bar, offset): {...}}.
+        
+        Each item has 'reads', 'read_bytes', 'read_time_ns', 'writes',
+        'write_bytes', 'write_time_ns' and 'histogram' ({upper bound of
+        latency bucket [ns]: count}). Writes coalesced by flush() share the
+        measured time equally.
+        """
+        if self._metrics is None:
+            return {}
+        return self._metrics.to_dict()
+    
+    def print_stats(self):
+        if self._metrics is not None:
+            self._metrics.print()
+            pass
+        return
+    
+    def reset_stats(self):
+        if self._metrics is not None:
+            self._metrics.reset()
+            pass
+        return
+    
+    def enable_trace(self, capacity=65536):
+        """Record every hardware access in a ring buffer.
+        
+        Parameters
+        ----------
+        capacity : int
+            Number of most recent accesses kept.
+        
+        Returns
+        -------
+        pyinterface.trace.register_tracer
+            Use to_arrays() or save() to get the records.
+        """
+        if (self.tracer is None) or (self.tracer.capacity != capacity):
+            if self.tracer is not None:
+                self._remove_observer(self.tracer)
+                pass
+            from .trace import register_tracer
+            self.tracer = register_tracer(capacity)
+            pass
+        self._add_observer(self.tracer)
+        return self.tracer
+    
+    def disable_trace(self):
+        """Stop recording; the tracer and its records are kept."""
+        if self.tracer is not None:
+            self._remove_observer(self.tracer)
+            pass
+        return
+    
+    def _get_window(self, bar_num, start, end):
+        key = (bar_num, start, end)
+        win = self._windows.get(key)
+        if win is None:
+            win = _batch_window(bar_num, start, end)
+            self._windows[key] = win
+            pass
+        return win
+    
+    def _load_window(self, win):
+        if self._write_back_mode:
+            # only the window's bar: its lock is held by the caller
+            self._flush_bar(win.bar_num, self._dirty[win.bar_num])
+            pass
+        
+        bar = self.bar[win.bar_num]
         
-        bit = ''
-        for f in flag_list:
-            if f in flags:
-                bit += '1'
+        observers = self._observers
+        if observers:
+            t0 = _monotonic_ns()
+            self.backend.read_into(bar, win.start, win.view)
+            dt = _monotonic_ns() - t0
+            for o in observers:
+                o.record(0, win.bar_num, win.start, win.buf, t0, dt)
+                continue
+        else:
+            self.backend.read_into(bar, win.start, win.view)
+            pass
+        
+        self.log_bytes_in[win.bar_num][win.start:win.end] = win.buf
+        win.valid = True
+        return
+    
+    def _read_from_batch(self, bar_num, offset, size):
+        for win in self._batch.get(bar_num, ()):
+            if win.start <= offset and offset + size <= win.end:
+                if not win.valid:
+                    self._load_window(win)
+                    pass
+                i = offset - win.start
+                return bytes(win.buf[i:i+size])
+            continue
+        return None
+    
+    def _invalidate_batch(self, bar_num):
+        for win in self._batch.get(bar_num, ()):
+            win.valid = False
+            continue
+        return
+    
+    def snapshot(self, bar_num, start, end):
+        """Read registers `start` to `end`-1 of a bar in one access.
+        
+        Inside read_batch(), later reads falling in the window are served
+        from the snapshot until the batch ends (or a write to the bar).
+        
+        Returns
+        -------
+        flagged_bytes
+        """
+        with self._locks[bar_num]:
+            win = self._get_window(bar_num, start, end)
+            self._load_window(win)
+            
+            if self._batch is not None:
+                wins = self._batch.setdefault(bar_num, [])
+                if win not in wins:
+                    wins.append(win)
+                    pass
+                pass
+            pass
+        
+        flag, flag_map = self._get_flag_slice('in', bar_num, start, end-start)
+        return flagged_bytes(bytes(win.buf), flag, flag_map=flag_map)
+    
+    @contextlib.contextmanager
+    def read_batch(self, windows=None):
+        """Serve reads from per-window snapshots until the block ends.
+        
+        Each window (`batch_windows` of the driver by default, or the given
+        (bar, start, end) list) is read in one bulk access on first use,
+        into a preallocated buffer. A write to a bar invalidates its
+        windows, which are then re-read on the next access.
+        
+        >>> with board.read_batch():
+        ...     latch = board.get_latch_status()
+        ...     ack = board.get_ack_status()
+        ...     inp = board.input_dword()
+        """
+        if windows is None:
+            windows = self.batch_windows
+            pass
+        
+        batch = {}
+        for bar_num, start, end in windows:
+            win = self._get_window(bar_num, start, end)
+            win.valid = False
+            batch.setdefault(bar_num, []).append(win)
+            continue
+        
+        prev = self._batch
+        self._batch = batch
+        try:
+            yield self
+        finally:
+            self._batch = prev
+            pass
+        return
+    
+    def locked(self, bar_num=None):
+        """Lock a bar (all bars if `bar_num` is None) for a multi-step
+        sequence.
+        
+        Every register access holds the lock of its bar, so single reads
+        and writes are already atomic; use locked() to keep other threads
+        out of a bar between several accesses, e.g. a read-modify-write.
+        The locks are reentrant, and bars are locked independently, so
+        the two axes of a PCI-7204 can be driven from two threads.
+        
+        >>> with board.locked(1):
+        ...     board.ppmc_write_command(cmd, axis=1)
+        ...     d = board.ppmc_read_data(axis=1)
+        
+        write_back() and read_batch() apply to the whole driver; use them
+        from one thread at a time.
+        """
+        if bar_num is not None:
+            return self._locks[bar_num]
+        return _lock_all(self._locks)
+    
+    def enable_shared_memory(self, name=None):
+        """Share log_bytes_in/log_bytes_out with other processes.
+        
+        The logs are moved into the shared memory segment `name`, created
+        with the current logs of this driver if it does not exist yet, and
+        the bar locks (see locked()) become cross-process locks. Drivers
+        of the same board in other processes must use the same name.
+        
+        Parameters
+        ----------
+        name : str, optional
+            Default: 'pyinterface-<driver class>-<board id>'.
+        
+        Returns
+        -------
+        pyinterface.shared.shared_registers
+        """
+        if self._shared is not None:
+            return self._shared
+        
+        if name is None:
+            name = 'pyinterface-{0}-{1}'.format(type(self).__name__,
+                                                 self.board_id)
+            pass
+        
+        from .shared import shared_registers
+        with self.locked():
+            sh = shared_registers.attach(
+                name, [len(_) for _ in self.log_bytes_out],
+                self.log_bytes_in, self.log_bytes_out)
+            self._shared = sh
+            self.log_bytes_in = sh.log_bytes_in
+            self.log_bytes_out = sh.log_bytes_out
+            self._locks = sh.locks
+            pass
+        return sh
+    
+    def disable_shared_memory(self, unlink=False):
+        """Go back to private logs (a copy of the shared ones)."""
+        sh = self._shared
+        if sh is None:
+            return
+        
+        with self.locked():
+            self.log_bytes_in = [bytearray(bytes(_)) for _ in sh.log_bytes_in]
+            self.log_bytes_out = [bytearray(bytes(_)) for _ in sh.log_bytes_out]
+            self._locks = [self.backend.bar_lock(_) for _ in self.bar]
+            self._shared = None
+            pass
+        sh.close()
+        if unlink:
+            sh.unlink()
+            pass
+        return
+    
+    def configure_timer(self, clocks, clear_status=True):
+        """Enable the interval timer API (set_timer(), wait_timer_tick()).
+        
+        pyinterface knows where the timer bits are (the TCTRL, SCK and
+        SIGT names of bit_flags_out / bit_flags_in), but not what the
+        board does with them, so nothing is written to the timer
+        registers until the encoding has been confirmed against the board
+        manual and given here. The layout used is:
+        
+        - control register: the interval is clocks[SCK] * TCTRL, with
+          the SCK and TCTRL bit fields; TCTRL = 0 stops the timer
+        - status register: SIGT is set at every tick and stays set until
+          it is cleared
+        
+        Parameters
+        ----------
+        clocks : sequence of float
+            Period [s] of the base clock selected by each value of SCK.
+        clear_status : bool
+            True if SIGT is cleared by writing it to the status register,
+            False if reading the status clears it.
+        """
+        if self.timer_control_register is None:
+            msg = '{0} has no interval timer'.format(type(self).__name__)
+            raise TimerNotConfiguredError(msg)
+        
+        bar, offset = self.timer_control_register
+        fields = self.flag_index_out[bar][offset]
+        count_mask = 0
+        clock_mask = 0
+        for name, (_, _, _, mask) in fields.items():
+            if name.startswith('TCTRL'):
+                count_mask |= mask
+            elif name.startswith('SCK'):
+                clock_mask |= mask
+                pass
+            continue
+        
+        bar, offset = self.timer_status_register
+        status_mask = self.flag_index_in[bar][offset]['SIGT'][3]
+        
+        self._timer = {
+            'clocks': tuple(clocks),
+            'clear_status': clear_status,
+            'count_mask': count_mask,
+            'clock_mask': clock_mask,
+            'status_mask': status_mask,
+            'setting': None,
+            'running': False,
+            'period_ns': 0,
+            'next_ns': 0,
+        }
+        return
+    
+    def _get_timer(self):
+        timer = self._timer
+        if timer is None:
+            msg = 'the timer of {0} is not configured;'.format(
+                type(self).__name__)
+            msg += ' call configure_timer() with the encoding of the board'
+            raise TimerNotConfiguredError(msg)
+        return timer
+    
+    def set_timer(self, interval):
+        """Set the period [s] of the interval timer.
+        
+        The setting closest to `interval` is chosen; a running timer
+        continues with the new period.
+        
+        Returns
+        -------
+        float
+            The period that is set [s].
+        """
+        timer = self._get_timer()
+        count_mask = timer['count_mask']
+        max_count = count_mask >> ((count_mask & -count_mask).bit_length() - 1)
+        clocks = timer['clocks']
+        
+        best = None
+        for sck, base in enumerate(clocks):
+            count = min(max(int(round(interval / base)), 1), max_count)
+            err = abs(count * base - interval)
+            if (best is None) or (err < best[0]):
+                best = (err, sck, count)
+                pass
+            continue
+        
+        if (best is None) or (best[0] > interval * 0.5):
+            msg = 'interval must be in {0}-{1} s,'.format(
+                min(clocks), max(clocks) * max_count)
+            msg += ' while {0} is given.'.format(interval)
+            raise InvalidTimerIntervalError(msg)
+        
+        err, sck, count = best
+        timer['setting'] = (sck, count)
+        timer['period_ns'] = int(round(clocks[sck] * count * 1e9))
+        if timer['running']:
+            self.start_timer()
+            pass
+        return clocks[sck] * count
+    
+    def _write_timer_control(self, sck, count):
+        timer = self._timer
+        value = 0
+        for field, mask in ((count, timer['count_mask']),
+                            (sck, timer['clock_mask'])):
+            value |= (field << ((mask & -mask).bit_length() - 1)) & mask
+            continue
+        bar, offset = self.timer_control_register
+        self.write_u8(bar, offset, value)
+        return
+    
+    def start_timer(self):
+        """Start the interval timer with the period of set_timer()."""
+        timer = self._get_timer()
+        if timer['setting'] is None:
+            raise TimerNotConfiguredError('call set_timer() first')
+        
+        sck, count = timer['setting']
+        bar, offset = self.timer_status_register
+        with self.locked(bar):
+            if timer['clear_status']:
+                self.write_u8(bar, offset, timer['status_mask'])
             else:
-                bit += '0'
+                self.read_u8(bar, offset)
                 pass
+            self._write_timer_control(sck, count)
+            timer['running'] = True
+            timer['next_ns'] = _monotonic_ns() + timer['period_ns']
+            pass
+        return
+    
+    def stop_timer(self):
+        timer = self._get_timer()
+        sck = timer['setting'][0] if timer['setting'] else 0
+        self._write_timer_control(sck, 0)
+        timer['running'] = False
+        return
+    
+    def wait_timer_tick(self, timeout=None):
+        """Wait for the next tick of the interval timer.
+        
+        Sleeps until `timer_spin` before the expected tick, then polls
+        SIGT every `timer_poll_interval` and clears it. Ticks missed
+        since the previous call count as one.
+        
+        Parameters
+        ----------
+        timeout : float, optional
+            [s]; TimeoutError is raised when it passes. None waits
+            forever.
+        """
+        timer = self._get_timer()
+        bar, offset = self.timer_status_register
+        mask = timer['status_mask']
+        read = self.read_u8
+        poll = self.timer_poll_interval
+        now = _monotonic_ns
+        
+        t = now()
+        deadline = None
+        if timeout is not None:
+            deadline = t + int(timeout * 1e9)
+            pass
+        
+        wake = timer['next_ns'] - int(self.timer_spin * 1e9)
+        if deadline is not None:
+            wake = min(wake, deadline)
+            pass
+        if wake > t:
+            time.sleep((wake - t) * 1e-9)
+            pass
+        
+        while not (read(bar, offset) & mask):
+            if (deadline is not None) and (now() >= deadline):
+                raise TimeoutError('timer tick is not detected')
+            time.sleep(poll)
             continue
         
-        d = bit2bytes(bit)
+        t = now()
+        if timer['clear_status']:
+            self.write_u8(bar, offset, mask)
+            pass
+        # a tick seen late moves the next wake-up earlier by timer_spin,
+        # so the schedule catches up with the board clock
+        timer['next_ns'] = t + timer['period_ns']
+        return
+    
+    def set_flag(self, bar_num, offset, flag):
+        d = self.encode_flag(bar_num, offset, flag)
         self.write(bar_num, offset, d)
         return
     
+    def encode_flag(self, bar_num, offset, flag):
+        reg_index = self.flag_index_out[bar_num][offset]
+        
+        value = 0
+        for f in flag.split():
+            item = reg_index.get(f)
+            if item is not None:
+                value |= item[3]
+                pass
+            continue
+        
+        return _byte_table[value]
+    
+    def write_channels(self, values):
+        """Set output channels by name, each register written once.
+        
+        >>> board.write_channels({'OUT3': 1, 'OUT17': 0, 'OUT18': 1})
+        
+        Parameters
+        ----------
+        values : dict
+            Channel name (see bit_flags_out) -> value. The value of a
+            channel spanning several bits is shifted into its bits;
+            ValueError is raised if it does not fit them. The other
+            bits of a register keep their value in log_bytes_out (see
+            modify()), except in registers listed in `write_through`,
+            which are written as set_flag() does, with the other bits 0.
+        """
+        plan = _cached_channel_plan(type(self), 'out', tuple(values))
+        # check every value before the first write
+        writes = []
+        for bar_num, offset, size, items, base in plan:
+            clear = bytearray(base)
+            xor = bytearray(size)
+            for name, i, bit, mask in items:
+                v = values[name] << bit
+                if v & ~mask:
+                    msg = 'value {0!r} does not fit channel {1}'.format(
+                        values[name], name)
+                    raise ValueError(msg)
+                clear[i] |= mask
+                xor[i] = (xor[i] & ~mask) | v
+                continue
+            writes.append((bar_num, offset, clear, xor))
+            continue
+        for bar_num, offset, clear, xor in writes:
+            self.modify(bar_num, offset, clear, xor)
+            continue
+        return
+    
+    def read_channels(self, names):
+        """Read input channels by name, each register read once.
+        
+        >>> board.read_channels(['IN1', 'IN17'])
+        {'IN1': 0, 'IN17': 1}
+        
+        Parameters
+        ----------
+        names : sequence of str
+            Channel names (see bit_flags_in).
+        
+        Returns
+        -------
+        dict
+            Channel name -> value (0 or 1 for single-bit channels).
+        """
+        names = tuple(names)
+        plan = _cached_channel_plan(type(self), 'in', names)
+        ret = dict.fromkeys(names)
+        for bar_num, offset, size, items in plan:
+            d = self._read_raw(bar_num, offset, size)
+            for name, i, bit, mask in items:
+                ret[name] = (d[i] & mask) >> bit
+                continue
+            continue
+        return ret
+    
     def get_log(self, in_out, bar_num, offset):
         if in_out == 'in':
             d = self.log_bytes_in[bar_num][offset:offset+1]
-            f = self.bit_flags_in[bar_num][offset:offset+1]
             
         elif in_out == 'out':            
             d = self.log_bytes_out[bar_num][offset:offset+1]
-            f = self.bit_flags_out[bar_num][offset:offset+1]
         
         else:
             return
-            
-        return flagged_bytes(d, f)
+        
+        f, flag_map = self._get_flag_slice(in_out, bar_num, offset, 1)
+        return flagged_bytes(d, f, flag_map=flag_map)
+    
+    def _get_flag_slice(self, in_out, bar_num, offset, size):
+        key = (in_out, bar_num, offset, size)
+        try:
+            return self._flag_slices[key]
+        except KeyError:
+            pass
+        
+        if in_out == 'in':
+            f = self.bit_flags_in[bar_num][offset:offset+size]
+        else:
+            f = self.bit_flags_out[bar_num][offset:offset+size]
+            pass
+        
+        ret = (f, compile_flag_map(f))
+        self._flag_slices[key] = ret
+        return ret
     
     
     def get_board_id(self):
@@ -103,21 +1192,24 @@ class interface_driver(object):
 
 
 class flagged_bytes(object):
-    bytes = b''
-    bit_flag = ()
-    fmt = ''
+    """Register value read from (or logged for) a board.
     
-    def __init__(self, bytes, bit_flag=(), fmt=''):
+    `bytes` may be any buffer (bytes, bytearray or memoryview); it is kept
+    as given, without copying. Decoded results (bit vector, unsigned value
+    and active flags) are computed on first use and cached, so the buffer
+    must not be modified after the object is created.
+    """
+    __slots__ = ('bytes', 'bit_flag', 'flag_map', 'fmt',
+                 '_bits', '_uint', '_flags')
+    
+    def __init__(self, bytes, bit_flag=(), fmt='', flag_map=None):
         self.bytes = bytes
-        
-        if bit_flag != ():
-            self.bit_flag = bit_flag
-            pass
-            
-        if fmt != '':
-            self.fmt = fmt
-            pass
-        
+        self.bit_flag = bit_flag
+        self.flag_map = flag_map
+        self.fmt = fmt
+        self._bits = None
+        self._uint = None
+        self._flags = None
         pass
         
     def __repr__(self):
@@ -126,18 +1218,38 @@ class flagged_bytes(object):
     
     def __getitem__(self, key):
         if isinstance(key, str):
-            dictlist = self.to_dictlist()
-            for item in self.to_dictlist():
-                if item['flag'] == key: 
-                    return item['value']
-                continue
-            return None
+            flag_map = self.flag_map
+            if flag_map is None:
+                flag_map = _cached_flag_map(self.bit_flag)
+                self.flag_map = flag_map
+                pass
+            
+            item = flag_map.get(key)
+            if item is None:
+                return None
+            
+            i, bit = item
+            if i >= len(self.bytes):
+                return None
+            return (self.bytes[i] >> bit) & 1
         
-        bit = self.to_list()
-        return bit[key]
+        bits = self._get_bits()
+        if isinstance(key, slice):
+            return list(bits[key])
+        return bits[key]
+    
+    def _get_bits(self):
+        bits = self._bits
+        if bits is None:
+            bits = tuple(bytes2list(self.bytes))
+            self._bits = bits
+            pass
+        return bits
         
-    def set_flag(self, flag):
+    def set_flag(self, flag, flag_map=None):
         self.bit_flag = flag
+        self.flag_map = flag_map
+        self._flags = None
         return
         
     def set_fmt(self, fmt):
@@ -151,66 +1263,54 @@ class flagged_bytes(object):
         return bytes2bit(self.bytes)
         
     def to_list(self):
-        return bytes2list(self.bytes)
+        return list(self._get_bits())
         
     def to_dictlist(self):
-        bit = self.to_list()
+        bit = self._get_bits()
         flag_list = [f for flags in self.bit_flag for f in flags]
         dictlist = [{'index': i, 'flag': f, 'value': b} for i, (b, f)
                     in enumerate(zip(bit, flag_list))]
         return dictlist
         
     def to_int(self):
-        if len(self.bytes) == 1:
-            return self.unpack('<b')
-        
-        if len(self.bytes) == 2:
-            return self.unpack('<h')
-        
-        if len(self.bytes) == 4:
-            return self.unpack('<i')
-
-        if len(self.bytes) == 8:
-            return self.unpack('<q')
-        
-        return 0
+        s = _int_structs.get(len(self.bytes))
+        if s is None:
+            return 0
+        return s.unpack(self.bytes)[0]
     
     def to_uint(self):
-        if len(self.bytes) == 1:
-            return self.unpack('<B')
-        
-        if len(self.bytes) == 2:
-            return self.unpack('<H')
-        
-        if len(self.bytes) == 4:
-            return self.unpack('<I')
-
-        if len(self.bytes) == 8:
-            return self.unpack('<Q')
-        
-        return 0
+        value = self._uint
+        if value is None:
+            s = _uint_structs.get(len(self.bytes))
+            if s is None:
+                return 0
+            value = s.unpack(self.bytes)[0]
+            self._uint = value
+            pass
+        return value
     
     def to_float(self):
-        if len(self.bytes) == 2:
-            return self.unpack('<e')
-        
-        if len(self.bytes) == 4:
-            return self.unpack('<f')
-
-        if len(self.bytes) == 8:
-            return self.unpack('<d')
-        
-        return 0.0
+        s = _float_structs.get(len(self.bytes))
+        if s is None:
+            return 0.0
+        return s.unpack(self.bytes)[0]
         
     def to_flags(self):
-        dictlist = self.to_dictlist()
-        flag = ' '.join([item['flag'] for item in dictlist 
-                         if item['value']==1])
-        return flag
+        flags = self._flags
+        if flags is None:
+            bit = self._get_bits()
+            flag_list = [f for names in self.bit_flag for f in names]
+            flags = ' '.join([f for b, f in zip(bit, flag_list) if b == 1])
+            self._flags = flags
+            pass
+        return flags
+    
+    def to_flag_set(self):
+        return frozenset(self.to_flags().split())
 
     def unpack(self, fmt=''):
         if fmt == '': fmt = self.fmt
-        ret = struct.unpack(fmt, self.bytes)
+        ret = _get_struct(fmt).unpack(self.bytes)
         if len(ret) == 1: ret = ret[0]
         return ret
 
@@ -234,3 +1334,29 @@ class flagged_bytes(object):
         print(msg)
         return
     
+
+
+
+@contextlib.contextmanager
+def _lock_all(locks):
+    # always in bar order, so that two threads cannot deadlock
+    with contextlib.ExitStack() as stack:
+        for lock in locks:
+            stack.enter_context(lock)
+            continue
+        yield
+        pass
+    return
+
+
+class _batch_window(object):
+    __slots__ = ('bar_num', 'start', 'end', 'buf', 'view', 'valid')
+    
+    def __init__(self, bar_num, start, end):
+        self.bar_num = bar_num
+        self.start = start
+        self.end = end
+        self.buf = bytearray(end - start)
+        self.view = memoryview(self.buf)
+        self.valid = False
+        pass
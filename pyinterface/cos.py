@@ -0,0 +1,274 @@
+"""
+Change-of-state detection for the digital inputs of PCI-2724 / PCI-2702.
+
+cos_engine compares every input sample with the previous one (XOR) and
+only does work for the bits that changed. Each change is recorded as an
+edge event (timestamp, channel, rising/falling) in a fixed-size ring
+buffer of preallocated arrays, and subscribers are called only when a bit
+of their watch mask changes:
+
+    >>> e = cos.cos_engine(board)
+    >>> e.subscribe(lambda ts, value, changed: print(hex(changed)),
+    ...             mask=0b1010)           # IN2 and IN4
+    >>> e.start(rate=1000)                 # poll input_dword_raw()
+    >>> ts, channel, rising, pos = e.events(0)
+    >>> e.stop()
+
+Samples taken elsewhere can be fed with update(value, timestamp), or in
+bulk with update_many(timestamps, values), e.g. from a dio_sampler; with
+numpy, unchanged samples of a bulk update are skipped without a Python
+loop.
+
+Channels are numbered from 1 (IN1 = bit0).
+"""
+
+import array
+import threading
+import time
+
+from .trace import _find_numpy
+
+
+_monotonic_ns = time.monotonic_ns
+
+# (name, array typecode)
+fields = (
+    ('timestamp', 'q'),
+    ('channel', 'B'),
+    ('rising', 'B'),
+)
+
+
+class cos_event_log(object):
+    """Ring buffer of edge events."""
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.arrays = {name: array.array(code, bytes(capacity * array.array(code).itemsize))
+                       for name, code in fields}
+        self.timestamp = self.arrays['timestamp']
+        self.channel = self.arrays['channel']
+        self.rising = self.arrays['rising']
+        self.count = 0
+        pass
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self.count = 0
+        return
+
+    def record(self, timestamp, changed, value):
+        # one event per set bit of `changed`, lowest channel first
+        cap = self.capacity
+        i = self.count
+        while changed:
+            low = changed & -changed
+            j = i % cap
+            self.timestamp[j] = timestamp
+            self.channel[j] = low.bit_length()
+            self.rising[j] = 1 if value & low else 0
+            i += 1
+            changed ^= low
+            continue
+        self.count = i
+        return
+
+    def since(self, pos):
+        """Return {field: array} of the events recorded since event number
+        `pos`, and the next pos.
+
+        Events already overwritten are skipped. numpy arrays are returned
+        when numpy is available, array.array otherwise.
+        """
+        count = self.count
+        start = max(pos, count - self.capacity)
+        i = start % self.capacity
+        j = i + (count - start)
+
+        numpy = _find_numpy()
+        ret = {}
+        for name, code in fields:
+            a = self.arrays[name]
+            if j <= self.capacity:
+                ordered = a[i:j]
+            else:
+                ordered = a[i:] + a[:j - self.capacity]
+                pass
+            if numpy:
+                ordered = numpy.frombuffer(ordered, dtype=numpy.dtype(code)).copy()
+                pass
+            ret[name] = ordered
+            continue
+        return ret, count
+
+
+class cos_engine(object):
+    """Detect changes of the inputs of a board.
+
+    Parameters
+    ----------
+    board : pci2724_driver or pci2702_driver
+    capacity : int
+        Number of most recent edge events kept.
+    """
+
+    def __init__(self, board, capacity=65536):
+        self.board = board
+        self.log = cos_event_log(capacity)
+        self.value = None
+        self.samples = 0
+        self.changes = 0
+        self._read = self._get_reader()
+        self._subscribers = ()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        pass
+
+    def _get_reader(self):
+        if self.board.io_number == 64:
+            return self.board.input_qword_raw
+        return self.board.input_dword_raw
+
+    def subscribe(self, callback, mask=-1):
+        """Call `callback(timestamp, value, changed)` when a bit of `mask`
+        changes; `changed` is the changed bits within `mask`.
+
+        Returns
+        -------
+        object
+            Handle for unsubscribe().
+        """
+        handle = (callback, mask)
+        with self._lock:
+            self._subscribers = self._subscribers + (handle,)
+            pass
+        return handle
+
+    def unsubscribe(self, handle):
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers
+                                      if s is not handle)
+            pass
+        return
+
+    def update(self, value, timestamp=None):
+        """Process one sample of the inputs.
+
+        The first sample sets the initial state without events.
+
+        Returns
+        -------
+        int
+            The changed bits.
+        """
+        self.samples += 1
+        prev = self.value
+        self.value = value
+        if prev is None:
+            return 0
+
+        changed = value ^ prev
+        if not changed:
+            return 0
+
+        if timestamp is None:
+            timestamp = _monotonic_ns()
+            pass
+        self.changes += 1
+        self.log.record(timestamp, changed, value)
+        for callback, mask in self._subscribers:
+            if changed & mask:
+                callback(timestamp, value, changed & mask)
+                pass
+            continue
+        return changed
+
+    def update_many(self, timestamps, values):
+        """Process a run of samples, e.g. from dio_sampler.since()."""
+        n = len(values)
+        if n == 0:
+            return
+
+        numpy = _find_numpy()
+        if numpy and isinstance(values, numpy.ndarray):
+            # only visit the samples that differ from their predecessor
+            if self.value is None:
+                self.value = int(values[0])
+                pass
+            prev = numpy.empty_like(values)
+            prev[0] = self.value
+            prev[1:] = values[:-1]
+            index = numpy.flatnonzero(values != prev)
+            self.samples += n - len(index)
+            for k in index:
+                self.update(int(values[k]), int(timestamps[k]))
+                continue
+            return
+
+        for t, v in zip(timestamps, values):
+            self.update(int(v), int(t))
+            continue
+        return
+
+    def poll(self):
+        """Read the inputs once and process the sample."""
+        t = _monotonic_ns()
+        return self.update(self._read(), t)
+
+    def events(self, pos=0):
+        """Return (timestamps, channels, rising, next pos) of the events
+        recorded since event number `pos`; `rising` is 1 for a rising
+        edge and 0 for a falling edge."""
+        ret, count = self.log.since(pos)
+        return ret['timestamp'], ret['channel'], ret['rising'], count
+
+    def start(self, rate):
+        """Poll the inputs at `rate` [Hz] in a background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(rate,),
+                                        daemon=True, name='cos_engine')
+        self._thread.start()
+        return
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return
+
+    def __enter__(self):
+        # start(rate) is called by the user; leaving the block stops it
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return
+
+    def _run(self, rate):
+        period = int(round(1e9 / rate))
+        read = self._read
+        update = self.update
+        stop = self._stop
+        now = _monotonic_ns
+
+        deadline = now()
+        while not stop.is_set():
+            t = now()
+            update(read(), t)
+            deadline += period
+            remaining = deadline - now()
+            if remaining > 0:
+                stop.wait(remaining * 1e-9)
+            else:
+                # skip the missed deadlines
+                deadline += (-remaining // period) * period
+                pass
+            continue
+        return
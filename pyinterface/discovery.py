@@ -0,0 +1,211 @@
+"""
+PCI discovery index.
+
+tools.open() finds boards through a discovery_index instead of scanning
+the bus on every call. The index runs lspci() once per board model and
+backend, and reads the board ID of each card with a single one-byte
+access to its board ID register (no driver is built for the scan).
+Drivers without a board_id_register are built, and their get_board_id()
+(a hex digit string, as board_id) is used instead.
+
+The board IDs can also be kept in an on-disk cache between processes:
+
+    >>> from pyinterface import discovery
+    >>> discovery.set_cache_path('/var/cache/pyinterface/boards.json')
+
+Keep the cache in a directory only the user of the tools (usually root)
+can write to: anyone able to replace the file can redirect open() to
+other boards.
+
+A cached entry is used only while the PCI topology reported by lspci()
+(bus/device/function, or the BAR addresses) is unchanged; otherwise the
+board IDs are read again. Call invalidate() after changing a board ID
+switch without moving the cards.
+"""
+
+import json
+import os
+import tempfile
+import weakref
+
+
+version = 1
+
+cache_path = None
+
+_indexes = weakref.WeakKeyDictionary()
+
+
+def topology_key(config):
+    """Return a JSON-serializable key identifying the slot of `config`."""
+    bus = getattr(config, 'bus', None)
+    if bus is not None:
+        return [bus, getattr(config, 'device', None),
+                getattr(config, 'function', None)]
+    return [[getattr(bar, 'addr', None), getattr(bar, 'size', None)]
+            for bar in config.bar]
+
+
+class discovery_index(object):
+    """(board_name, board_id) -> PCI config of one backend.
+
+    Parameters
+    ----------
+    backend : backend
+        Backend used for lspci() and the board ID reads.
+    cache_path : str, optional
+        JSON file to keep the board IDs in between processes.
+    """
+
+    def __init__(self, backend, cache_path=None):
+        self.backend = backend
+        self.cache_path = cache_path
+        self.scans = 0
+        self._boards = {}
+        # models whose board IDs were taken from the on-disk cache
+        self._from_cache = set()
+        pass
+
+    def boards(self, board_name):
+        """Return {board_id (int): pci_config} of the `board_name` cards."""
+        boards = self._boards.get(board_name)
+        if boards is None:
+            boards = self._scan(board_name)
+            self._boards[board_name] = boards
+            pass
+        return boards
+
+    def find(self, board_name, board_id):
+        """Return the PCI config of the card, or None if it is not found."""
+        return self.boards(board_name).get(board_id)
+
+    def from_cache(self, board_name):
+        """Return True if the board IDs of `board_name` come from the
+        on-disk cache, i.e. were not read in this process."""
+        return board_name in self._from_cache
+
+    def invalidate(self, board_name=None):
+        """Forget the scan of `board_name` (or of all models), both in
+        memory and in the on-disk cache."""
+        if board_name is None:
+            self._boards.clear()
+            self._from_cache.clear()
+        else:
+            self._boards.pop(board_name, None)
+            self._from_cache.discard(board_name)
+            pass
+
+        if self.cache_path is not None:
+            cache = self._load_cache()
+            if board_name is None:
+                cache.clear()
+            else:
+                cache.pop(str(board_name), None)
+                pass
+            self._save_cache(cache)
+            pass
+        return
+
+    def _scan(self, board_name):
+        from .registry import get_driver_class
+        from .tools import interface_vendor_id
+
+        self.scans += 1
+        configs = self.backend.lspci(interface_vendor_id, board_name)
+        topology = [topology_key(c) for c in configs]
+
+        cache = None
+        if self.cache_path is not None:
+            cache = self._load_cache()
+            entry = cache.get(str(board_name))
+            if entry is not None and entry['topology'] == topology:
+                self._from_cache.add(board_name)
+                return dict(zip(entry['board_ids'], configs))
+            pass
+        self._from_cache.discard(board_name)
+
+        driver = get_driver_class(board_name)
+        if driver.board_id_register is None:
+            # plugin driver with its own get_board_id()
+            board_ids = [int(driver(c, self.backend).board_id, 16)
+                         for c in configs]
+        else:
+            bar, offset = driver.board_id_register
+            board_ids = [self.read_board_id(c, bar, offset) for c in configs]
+            pass
+
+        if cache is not None:
+            cache[str(board_name)] = {'topology': topology,
+                                      'board_ids': board_ids}
+            self._save_cache(cache)
+            pass
+        return dict(zip(board_ids, configs))
+
+    def read_board_id(self, config, bar, offset):
+        return self.backend.read(config.bar[bar], offset, 1)[0] & 0x0f
+
+    def _load_cache(self):
+        try:
+            fd = os.open(self.cache_path, os.O_RDONLY | os.O_NOFOLLOW)
+            with os.fdopen(fd) as f:
+                d = json.load(f)
+                pass
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(d, dict) or d.get('version') != version:
+            return {}
+        return d.get('models', {})
+
+    def _save_cache(self, models):
+        # write to a new temporary file first (mkstemp: O_EXCL, so not a
+        # file or link planted by someone else), so that a reader never
+        # sees a half-written cache
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        except OSError:
+            # the cache is only an optimization
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': version, 'models': models}, f)
+                pass
+            # replaces a link at cache_path itself, not its target
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            pass
+        return
+
+
+def get_index(backend):
+    """Return the discovery index of `backend`, created on first use."""
+    index = _indexes.get(backend)
+    if index is None:
+        index = discovery_index(backend, cache_path)
+        _indexes[backend] = index
+        pass
+    return index
+
+def set_cache_path(path):
+    """Keep board IDs in `path` (None disables the on-disk cache)."""
+    global cache_path
+    cache_path = path
+    for index in _indexes.values():
+        index.cache_path = path
+        continue
+    return
+
+def invalidate(board_name=None):
+    """Forget the scans of all backends (see discovery_index.invalidate)."""
+    for index in list(_indexes.values()):
+        index.invalidate(board_name)
+        continue
+
+    if not _indexes and cache_path is not None:
+        discovery_index(None, cache_path).invalidate(board_name)
+        pass
+    return
@@ -0,0 +1,83 @@
+"""
+Per-register access metrics.
+
+register_metrics is attached to a driver with
+interface_driver.enable_stats() and records every hardware access made
+by the driver: calls, bytes and cumulative time per (bar, offset), read
+and write separately, plus a latency histogram with power-of-two
+nanosecond buckets.
+"""
+
+import threading
+
+READ = 0
+WRITE = 1
+
+histogram_buckets = 64
+
+
+class register_metrics(object):
+    def __init__(self):
+        # record() is called under the lock of the accessed bar; accesses
+        # to different bars may record concurrently
+        self._lock = threading.Lock()
+        self.reset()
+        pass
+
+    def reset(self):
+        # (bar, offset) -> [read calls, read bytes, read ns,
+        #                   write calls, write bytes, write ns, histogram]
+        with self._lock:
+            self.registers = {}
+            pass
+        return
+
+    def record(self, kind, bar_num, offset, data, t0_ns, elapsed_ns):
+        key = (bar_num, offset)
+        i = 3 * kind
+        bucket = min(elapsed_ns.bit_length(), histogram_buckets - 1)
+        with self._lock:
+            entry = self.registers.get(key)
+            if entry is None:
+                entry = [0, 0, 0, 0, 0, 0, [0] * histogram_buckets]
+                self.registers[key] = entry
+                pass
+
+            entry[i] += 1
+            entry[i+1] += len(data)
+            entry[i+2] += elapsed_ns
+            entry[6][bucket] += 1
+            pass
+        return
+
+    def _copy(self):
+        # record() may add registers from other threads meanwhile
+        with self._lock:
+            return {key: e[:6] + [list(e[6])]
+                    for key, e in self.registers.items()}
+
+    def to_dict(self):
+        """Return {(bar, offset): {...}} with counters and a histogram
+        {upper bound [ns]: count} of the non-empty buckets."""
+        ret = {}
+        for key, e in sorted(self._copy().items()):
+            ret[key] = {
+                'reads': e[0],
+                'read_bytes': e[1],
+                'read_time_ns': e[2],
+                'writes': e[3],
+                'write_bytes': e[4],
+                'write_time_ns': e[5],
+                'histogram': {(1 << b): n for b, n in enumerate(e[6]) if n},
+            }
+            continue
+        return ret
+
+    def print(self):
+        msg = ' bar offset    reads  r-bytes   r-time[us]   writes  w-bytes   w-time[us]\n'
+        for (bar_num, offset), e in sorted(self._copy().items()):
+            msg += '{0:4d}  0x{1:02x} {2:8d} {3:8d} {4:12.1f} {5:8d} {6:8d} {7:12.1f}\n'.format(
+                bar_num, offset, e[0], e[1], e[2] / 1e3, e[3], e[4], e[5] / 1e3)
+            continue
+        print(msg)
+        return
@@ -2,6 +2,7 @@
 
 import struct
 from . import core
+from . import registry
 
 
 class InvalidIoNumberError(Exception):
@@ -11,6 +12,7 @@ class InvalidListLengthError(Exception):
     pass
 
     
+@registry.register_driver(2702)
 class pci2702_driver(core.interface_driver):
     bit_flags_in = (
         (
@@ -56,9 +58,27 @@ class pci2702_driver(core.interface_driver):
     
     io_number = 64
     
+    # (start, num) -> bit mask of the points
+    point_masks = core.compile_point_masks(io_number)
+    
+    # ACK/STB/PULS.OUT commands, timer control and status
+    write_through = ((0, 0x08), (0, 0x09), (0, 0x0a), (0, 0x0c))
+    
+    # inputs, ACK/STB status, timer data and latch setting
+    batch_windows = ((0, 0x00, 0x0c),)
+    
+    # outputs and latch setting
+    idempotent_registers = tuple((0, o) for o in range(0x08)) + ((0, 0x0b),)
+    
+    board_id_register = (0, 0x0f)
+    
+    # interval timer (TCTRL/SCK) and its status (SIGT); see
+    # interface_driver.configure_timer()
+    timer_control_register = (0, 0x0a)
+    timer_status_register = (0, 0x0c)
+    
     def get_board_id(self):
-        bar = 0
-        offset = 0x0f
+        bar, offset = self.board_id_register
         size = 1
         
         ret = self.read(bar, offset, size)
@@ -82,7 +102,7 @@ class pci2702_driver(core.interface_driver):
           initialize() を実行しなくともドライバへアクセス可能です。
         - initialize() を実行しない場合、直前のボード状況が反映されています。
         """
-        self.output_dword(0)
+        self.output_qword_raw(0)
         self.set_latch_status()
         self.set_ack_pulse_command()
         self.set_stb_pulse_command()
@@ -97,6 +117,44 @@ class pci2702_driver(core.interface_driver):
         return
     
     
+    def _get_point_mask(self, start, num):
+        mask = self.point_masks.get((start, num))
+        if mask is None:
+            self._verify_io_number_access(start, num)
+            msg = 'I/O number {0}-{1} is not a valid range.'.format(
+                start, start+num-1)
+            raise InvalidIoNumberError(msg)
+        return mask
+    
+    
+    def _verify_bit_mask(self, mask):
+        if (mask < 0) or (mask >> self.io_number):
+            msg = 'mask must be in 0-0x{0:x},'.format((1 << self.io_number) - 1)
+            msg += ' while 0x{0:x} is given.'.format(mask)
+            raise InvalidIoNumberError(msg)
+        return
+    
+    
+    def _read_points(self):
+        return self.read_u64(0, 0x00)
+    
+    
+    def _update_outputs(self, clear_mask, xor_mask):
+        # outputs = (outputs & ~clear_mask) ^ xor_mask, written as one
+        # access covering only the bytes that contain changed bits
+        touched = clear_mask | xor_mask
+        if touched == 0:
+            return
+        
+        bar = 0
+        first = ((touched & -touched).bit_length() - 1) >> 3
+        last = (touched.bit_length() - 1) >> 3
+        clear = clear_mask.to_bytes(8, 'little')[first:last+1]
+        xor = xor_mask.to_bytes(8, 'little')[first:last+1]
+        self.modify(bar, 0x00 + first, clear, xor)
+        return
+    
+    
     def input_point(self, start, num):
         """デジタル入力を任意点数取得します
         
@@ -123,10 +181,9 @@ class pci2702_driver(core.interface_driver):
         >>> pci2702.input_point(2, 5)
         [1, 0, 1, 0, 1]
         """
-        self._verify_io_number_access(start, num)
-        inp = self.input_dword()
-        bits = inp.to_list()[start-1:start+num-1]
-        return bits
+        mask = self._get_point_mask(start, num)
+        inp = (self._read_points() & mask) >> (start - 1)
+        return [(inp >> i) & 1 for i in range(num)]
     
     
     def output_point(self, data, start):
@@ -150,19 +207,70 @@ class pci2702_driver(core.interface_driver):
         >>> pci2702.output_point([1,1,1,1], 3)
         3C000000
         """
-        bar = 0
-        offset = 0x00
-        
-        num = len(data)
-        self._verify_io_number_access(start, num)
-        new_d = self.log_bytes_out[0][0:4]
-        new_d = core.bytes2list(new_d)
-        new_d[start-1:start+num-1] = data
-        new_d = core.list2bytes(new_d)
-        self.write(bar, offset, new_d)
+        mask = self._get_point_mask(start, len(data))
+        value = int.from_bytes(core.list2bytes(data), 'little') << (start - 1)
+        self._update_outputs(mask, value & mask)
         return 
     
     
+    def set_bits(self, mask):
+        """mask で指定したデジタル出力を ON にします
+        
+        Notes
+        -----
+        他のチャンネルの出力は変更しません。mask の bit が立っているバイトのみを
+        1 回のアクセスで書き込みます。
+        
+        Parameters
+        ----------
+        mask : int
+            ON にするチャンネルのビットマスク (OUT1 が bit0)
+        
+        Examples
+        --------
+        OUT1 と OUT4 を ON にします
+        
+        >>> pci2702.set_bits(0b1001)
+        """
+        self._verify_bit_mask(mask)
+        self._update_outputs(mask, mask)
+        return
+    
+    
+    def clear_bits(self, mask):
+        """mask で指定したデジタル出力を OFF にします
+        
+        Notes
+        -----
+        他のチャンネルの出力は変更しません。
+        
+        Parameters
+        ----------
+        mask : int
+            OFF にするチャンネルのビットマスク (OUT1 が bit0)
+        """
+        self._verify_bit_mask(mask)
+        self._update_outputs(mask, 0)
+        return
+    
+    
+    def toggle_bits(self, mask):
+        """mask で指定したデジタル出力を反転します
+        
+        Notes
+        -----
+        他のチャンネルの出力は変更しません。
+        
+        Parameters
+        ----------
+        mask : int
+            反転するチャンネルのビットマスク (OUT1 が bit0)
+        """
+        self._verify_bit_mask(mask)
+        self._update_outputs(0, mask)
+        return
+    
+    
     def input_byte(self, range_):
         """デジタル入力を1byte単位で取得します
         
@@ -322,7 +430,7 @@ class pci2702_driver(core.interface_driver):
         --------
         IN1 - IN32 のデジタル入力状況を取得します
         
-        >>> pci2702.input_dword()
+        >>> pci2702.input_dword('IN1_32')
         [1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 0, 1, 0, 1, 0,
          1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 0, 1, 0, 1, 0]
         """
@@ -334,6 +442,75 @@ class pci2702_driver(core.interface_driver):
         
         d = self.read(bar, offset, size)
         return d
+    
+    
+    def input_dword_raw(self, range_):
+        """デジタル入力を4byte取得し、int で返します
+        
+        Notes
+        -----
+        input_dword() と同じレジスタを読みますが、flagged_bytes を生成しません。
+        範囲の最初のチャンネルが bit0 に対応します。
+        
+        Parameters
+        ----------
+        range_ : str
+            'IN1_32' または 'IN33_64'
+        
+        Returns
+        -------
+        int
+            デジタル入力状況 (unsigned 32bit)
+        """
+        if range_ == 'IN1_32': offset = 0x00
+        elif range_ == 'IN33_64': offset = 0x04
+        else: return
+        
+        return self.read_u32(0, offset)
+
+        
+    def input_qword(self):
+        """デジタル入力を8byte (IN1 - IN64) 一括で取得します
+        
+        Notes
+        -----
+        64 点の入力レジスタを 1 回のアクセスで読みます。
+        
+        Returns
+        -------
+        list
+            デジタル入力状況のリスト (length=64)
+        
+        Examples
+        --------
+        >>> pci2702.input_qword()
+        [1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 0, 1, 0, 1, 0,
+         1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 0, 1, 0, 1, 0,
+         1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 0, 1, 0, 1, 0,
+         1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 0, 1, 0, 1, 0]
+        """
+        bar = 0
+        offset = 0x00
+        size = 8
+        
+        d = self.read(bar, offset, size)
+        return d
+    
+    
+    def input_qword_raw(self):
+        """デジタル入力を8byte (IN1 - IN64) 一括で取得し、int で返します
+        
+        Notes
+        -----
+        input_qword() と同じレジスタを読みますが、flagged_bytes を生成しません。
+        IN1 が bit0 に対応します。
+        
+        Returns
+        -------
+        int
+            デジタル入力状況 (unsigned 64bit)
+        """
+        return self.read_u64(0, 0x00)
 
         
     def output_byte(self, range_, data, fmt=''):
@@ -549,7 +726,7 @@ class pci2702_driver(core.interface_driver):
         OUT1 より 4byte 分のチャンネルのデジタル出力を設定します
         
         >>> d = [1,0,1,0,1,0,1,0,1,1,1,1,0,0,0,0,1,0,1,0,1,0,1,0,1,1,1,1,0,0,0,0]
-        >>> pci2702.output_dword(d)
+        >>> pci2702.output_dword('OUT1_32', d)
         """
         bar = 0
         
@@ -577,6 +754,100 @@ class pci2702_driver(core.interface_driver):
         self.write(bar, offset, d)
         return 
     
+    
+    def output_dword_raw(self, range_, data):
+        """デジタル出力を4byte設定します (int 指定)
+        
+        Notes
+        -----
+        output_dword(range_, data, fmt='<I') と同じ動作ですが、struct の書式解析を行いません。
+        範囲の最初のチャンネルが bit0 に対応します。
+        
+        Parameters
+        ----------
+        range_ : str
+            'OUT1_32' または 'OUT33_64'
+        data : int
+            設定するデジタル出力状況 (unsigned 32bit)
+        """
+        if range_ == 'OUT1_32': offset = 0x00
+        elif range_ == 'OUT33_64': offset = 0x04
+        else: return
+        
+        self.write_u32(0, offset, data)
+        return
+    
+
+    def output_qword(self, data, fmt=''):
+        """デジタル出力を8byte (OUT1 - OUT64) 一括で設定します
+        
+        Notes
+        -----
+        64 点の出力レジスタを 1 回のアクセスで書きます。
+        
+        Parameters
+        ----------
+        data : list or int or float
+            list の場合
+                設定するデジタル出力状況のリストです (1:ON, 0:OFF)。
+                length は 64 にしてください。
+            int の場合
+                signed int の bytes に変換して設定されます。
+            unsigned int を設定したい場合
+                data に正の int を代入し、fmt に '<Q' を指定してください。
+        
+        fmt : str (option)
+            fmt を指定した場合、data を fmt に従って pack しようとします。
+            fmt に使用する文字列は、struct モジュールの書式です。
+
+        Examples
+        --------
+        OUT1 - OUT64 のデジタル出力を設定します
+        
+        >>> d = [1,0,1,0,1,0,1,0,1,1,1,1,0,0,0,0] * 4
+        >>> pci2702.output_qword(d)
+        """
+        bar = 0
+        offset = 0x00
+        
+        if fmt != '':
+            d = struct.pack(fmt, data)
+        
+        elif type(data) in [list, tuple]: 
+            if len(data) != 64:
+                msg = 'data length must be 64, not {0}'.format(len(data))
+                raise InvalidListLengthError(msg)
+            d = core.list2bytes(data)
+        
+        elif type(data) == int:
+            d = struct.pack('<q', data)
+            
+        elif type(data) == float:
+            d = struct.pack('<d', data)
+            
+        else:
+            return
+
+        self.write(bar, offset, d)
+        return 
+    
+    
+    def output_qword_raw(self, data):
+        """デジタル出力を8byte (OUT1 - OUT64) 一括で設定します (int 指定)
+        
+        Notes
+        -----
+        output_qword(data, fmt='<Q') と同じ動作ですが、struct の書式解析を行いません。
+        OUT1 が bit0 に対応します。
+        
+        Parameters
+        ----------
+        data : int
+            設定するデジタル出力状況 (unsigned 64bit)
+        """
+        self.write_u64(0, 0x00, data)
+        return
+    
 
     def set_latch_status(self, enable=''):
         """ラッチ回路の接続を設定します
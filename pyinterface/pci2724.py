@@ -33,10 +33,26 @@ PCI/CPZ-2724 DIO ボードのドライバです。概ね公式ドライバ GPG-2
     - DioInputDword
     - デジタル入力を4byte単位で取得します
 
+  * - `input_dword_raw() <#pyinterface.pci2724.pci2724_driver.input_dword_raw>`_
+    - 
+    - デジタル入力を4byte単位で取得し、int で返します
+
   * - `output_point(data, start) <#pyinterface.pci2724.pci2724_driver.output_point>`_
     - DioOutputPoint
     - デジタル出力を任意点数設定します
 
+  * - `set_bits(mask) <#pyinterface.pci2724.pci2724_driver.set_bits>`_
+    - 
+    - mask で指定したデジタル出力を ON にします
+
+  * - `clear_bits(mask) <#pyinterface.pci2724.pci2724_driver.clear_bits>`_
+    - 
+    - mask で指定したデジタル出力を OFF にします
+
+  * - `toggle_bits(mask) <#pyinterface.pci2724.pci2724_driver.toggle_bits>`_
+    - 
+    - mask で指定したデジタル出力を反転します
+
   * - `output_byte(range_) <#pyinterface.pci2724.pci2724_driver.output_byte>`_
     - DioOutputByte
     - デジタル出力を1byte単位で設定します
@@ -48,6 +64,10 @@ PCI/CPZ-2724 DIO ボードのドライバです。概ね公式ドライバ GPG-2
   * - `output_dword() <#pyinterface.pci2724.pci2724_driver.output_dword>`_
     - DioOutputDword
     - デジタル出力を4byte単位で設定します
+
+  * - `output_dword_raw(data) <#pyinterface.pci2724.pci2724_driver.output_dword_raw>`_
+    - 
+    - デジタル出力を4byte単位で int から設定します
  
   * - `set_latch_status(enable) <#pyinterface.pci2724.pci2724_driver.set_latch_status>`_
     - DioSetLatchStatus
@@ -77,6 +97,7 @@ PCI/CPZ-2724 DIO ボードのドライバです。概ね公式ドライバ GPG-2
 
 import struct
 from . import core
+from . import registry
 
 
 class InvalidIoNumberError(Exception):
@@ -86,6 +107,7 @@ class InvalidListLengthError(Exception):
     pass
 
     
+@registry.register_driver(2724)
 class pci2724_driver(core.interface_driver):
     bit_flags_in = (
         (
@@ -131,9 +153,27 @@ class pci2724_driver(core.interface_driver):
     
     io_number = 32
     
+    # (start, num) -> bit mask of the points
+    point_masks = core.compile_point_masks(io_number)
+    
+    # ACK/STB/PULS.OUT commands, timer control and status
+    write_through = ((0, 0x08), (0, 0x09), (0, 0x0a), (0, 0x0c))
+    
+    # inputs, ACK/STB status, timer data and latch setting
+    batch_windows = ((0, 0x00, 0x0c),)
+    
+    # outputs and latch setting
+    idempotent_registers = tuple((0, o) for o in range(0x04)) + ((0, 0x0b),)
+    
+    board_id_register = (0, 0x0f)
+    
+    # interval timer (TCTRL/SCK) and its status (SIGT); see
+    # interface_driver.configure_timer()
+    timer_control_register = (0, 0x0a)
+    timer_status_register = (0, 0x0c)
+    
     def get_board_id(self):
-        bar = 0
-        offset = 0x0f
+        bar, offset = self.board_id_register
         size = 1
         
         ret = self.read(bar, offset, size)
@@ -172,6 +212,44 @@ class pci2724_driver(core.interface_driver):
         return
     
     
+    def _get_point_mask(self, start, num):
+        mask = self.point_masks.get((start, num))
+        if mask is None:
+            self._verify_io_number_access(start, num)
+            msg = 'I/O number {0}-{1} is not a valid range.'.format(
+                start, start+num-1)
+            raise InvalidIoNumberError(msg)
+        return mask
+    
+    
+    def _verify_bit_mask(self, mask):
+        if (mask < 0) or (mask >> self.io_number):
+            msg = 'mask must be in 0-0x{0:x},'.format((1 << self.io_number) - 1)
+            msg += ' while 0x{0:x} is given.'.format(mask)
+            raise InvalidIoNumberError(msg)
+        return
+    
+    
+    def _read_points(self):
+        return int.from_bytes(self._read_raw(0, 0x00, 4), 'little')
+    
+    
+    def _update_outputs(self, clear_mask, xor_mask):
+        # outputs = (outputs & ~clear_mask) ^ xor_mask, written as one
+        # access covering only the bytes that contain changed bits
+        touched = clear_mask | xor_mask
+        if touched == 0:
+            return
+        
+        bar = 0
+        first = ((touched & -touched).bit_length() - 1) >> 3
+        last = (touched.bit_length() - 1) >> 3
+        clear = clear_mask.to_bytes(4, 'little')[first:last+1]
+        xor = xor_mask.to_bytes(4, 'little')[first:last+1]
+        self.modify(bar, 0x00 + first, clear, xor)
+        return
+    
+    
     def input_point(self, start, num):
         """デジタル入力を任意点数取得します
         
@@ -198,10 +276,9 @@ class pci2724_driver(core.interface_driver):
         >>> pci2724.input_point(2, 5)
         [1, 0, 1, 0, 1]
         """
-        self._verify_io_number_access(start, num)
-        inp = self.input_dword()
-        bits = inp.to_list()[start-1:start+num-1]
-        return bits
+        mask = self._get_point_mask(start, num)
+        inp = (self._read_points() & mask) >> (start - 1)
+        return [(inp >> i) & 1 for i in range(num)]
     
     
     def output_point(self, data, start):
@@ -225,19 +302,70 @@ class pci2724_driver(core.interface_driver):
         >>> pci2724.output_point([1,1,1,1], 3)
         3C000000
         """
-        bar = 0
-        offset = 0x00
-        
-        num = len(data)
-        self._verify_io_number_access(start, num)
-        new_d = self.log_bytes_out[0][0:4]
-        new_d = core.bytes2list(new_d)
-        new_d[start-1:start+num-1] = data
-        new_d = core.list2bytes(new_d)
-        self.write(bar, offset, new_d)
+        mask = self._get_point_mask(start, len(data))
+        value = int.from_bytes(core.list2bytes(data), 'little') << (start - 1)
+        self._update_outputs(mask, value & mask)
         return 
     
     
+    def set_bits(self, mask):
+        """mask で指定したデジタル出力を ON にします
+        
+        Notes
+        -----
+        他のチャンネルの出力は変更しません。mask の bit が立っているバイトのみを
+        1 回のアクセスで書き込みます。
+        
+        Parameters
+        ----------
+        mask : int
+            ON にするチャンネルのビットマスク (OUT1 が bit0)
+        
+        Examples
+        --------
+        OUT1 と OUT4 を ON にします
+        
+        >>> pci2724.set_bits(0b1001)
+        """
+        self._verify_bit_mask(mask)
+        self._update_outputs(mask, mask)
+        return
+    
+    
+    def clear_bits(self, mask):
+        """mask で指定したデジタル出力を OFF にします
+        
+        Notes
+        -----
+        他のチャンネルの出力は変更しません。
+        
+        Parameters
+        ----------
+        mask : int
+            OFF にするチャンネルのビットマスク (OUT1 が bit0)
+        """
+        self._verify_bit_mask(mask)
+        self._update_outputs(mask, 0)
+        return
+    
+    
+    def toggle_bits(self, mask):
+        """mask で指定したデジタル出力を反転します
+        
+        Notes
+        -----
+        他のチャンネルの出力は変更しません。
+        
+        Parameters
+        ----------
+        mask : int
+            反転するチャンネルのビットマスク (OUT1 が bit0)
+        """
+        self._verify_bit_mask(mask)
+        self._update_outputs(0, mask)
+        return
+    
+    
     def input_byte(self, range_):
         """デジタル入力を1byte単位で取得します
         
@@ -366,6 +494,27 @@ class pci2724_driver(core.interface_driver):
         
         d = self.read(bar, offset, size)
         return d
+    
+    
+    def input_dword_raw(self):
+        """デジタル入力を4byte取得し、int で返します
+        
+        Notes
+        -----
+        input_dword() と同じレジスタを読みますが、flagged_bytes を生成しません。
+        IN1 が bit0 に対応します。
+        
+        Returns
+        -------
+        int
+            デジタル入力状況 (unsigned 32bit)
+        
+        Examples
+        --------
+        >>> pci2724.input_dword_raw()
+        1431655765
+        """
+        return self.read_u32(0, 0x00)
 
         
     def output_byte(self, range_, data, fmt=''):
@@ -568,6 +717,27 @@ class pci2724_driver(core.interface_driver):
         self.write(bar, offset, d)
         return 
     
+    
+    def output_dword_raw(self, data):
+        """デジタル出力を4byte設定します (int 指定)
+        
+        Notes
+        -----
+        output_dword(data, fmt='<I') と同じ動作ですが、struct の書式解析を行いません。
+        OUT1 が bit0 に対応します。
+        
+        Parameters
+        ----------
+        data : int
+            設定するデジタル出力状況 (unsigned 32bit)
+        
+        Examples
+        --------
+        >>> pci2724.output_dword_raw(0x0000000f)
+        """
+        self.write_u32(0, 0x00, data)
+        return
+    
 
     def set_latch_status(self, enable=''):
         """ラッチ回路の接続を設定します
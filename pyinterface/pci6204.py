@@ -1,12 +1,14 @@
 
 import struct
 from . import core
+from . import registry
 
 
 class InvalidChannelError(Exception):
     pass
 
 
+@registry.register_driver(6204)
 class pci6204_driver(core.interface_driver):
     bit_flags_in = (
         (
@@ -118,10 +120,22 @@ class pci6204_driver(core.interface_driver):
         )
     )
     
+    # counter/comparator data (written value is loaded by the write),
+    # P/L selection and CC0/CC1 commands of ch1 and ch2
+    write_through = tuple((0, base + o) for base in (0x00, 0x10)
+                          for o in (0x00, 0x01, 0x02, 0x03, 0x05, 0x06))
+    
+    # latched count, mode and status of ch1 and ch2
+    batch_windows = ((0, 0x00, 0x08), (0, 0x10, 0x18))
+    
+    # mode and Z mode of ch1 and ch2
+    idempotent_registers = ((0, 0x04), (0, 0x07), (0, 0x14), (0, 0x17))
+    
+    
+    board_id_register = (1, 0x0f)
     
     def get_board_id(self):
-        bar = 1
-        offset = 0x0f
+        bar, offset = self.board_id_register
         size = 1
         
         ret = self.read(bar, offset, size)
@@ -337,9 +351,8 @@ class pci6204_driver(core.interface_driver):
         bar = 0
         offset = self._get_offset_for(ch, 0x05)
         
-        flags = self.get_log('out', bar, offset).to_flags()
-        flags = flags.replace('P/L', '')
-        self.set_flag(bar, offset, flags)
+        # only P/L changes; /EN is kept (by the server for remote backends)
+        self.modify(bar, offset, b'\x01', b'\x00')
         return
     
 
@@ -347,9 +360,7 @@ class pci6204_driver(core.interface_driver):
         bar = 0
         offset = self._get_offset_for(ch, 0x05)
         
-        flags = self.get_log('out', bar, offset).to_flags()
-        flags += ' P/L'
-        self.set_flag(bar, offset, flags)
+        self.modify(bar, offset, b'\x01', b'\x01')
         return
     
 
@@ -363,8 +374,10 @@ class pci6204_driver(core.interface_driver):
         
         d = struct.pack('<i', count)
         
-        self.set_counter_mode()
-        self.write(bar, offset, d)
+        with self.locked(bar):
+            self.set_counter_mode(ch)
+            self.write(bar, offset, d)
+            pass
         return
     
     
@@ -378,8 +391,10 @@ class pci6204_driver(core.interface_driver):
         
         d = struct.pack('<i', count)
         
-        self.set_comparator_mode()
-        self.write(bar, offset, d)
+        with self.locked(bar):
+            self.set_comparator_mode(ch)
+            self.write(bar, offset, d)
+            pass
         return
         
     
@@ -400,13 +415,32 @@ class pci6204_driver(core.interface_driver):
         offset = self._get_offset_for(ch, 0x00)
         size = 4
         
-        self.set_counter_mode()
-        self.latch(ch)
-        d = self.read(bar, offset, size)
+        with self.locked(bar):
+            self.set_counter_mode(ch)
+            self.latch(ch)
+            d = self.read(bar, offset, size)
+            pass
         d.set_fmt('<i')
         return d
 
     
+    def get_counter_raw(self, ch=1):
+        """Get count value as a signed int, without building flagged_bytes.
+        """
+        bar = 0
+        offset = self._get_offset_for(ch, 0x00)
+        
+        with self.locked(bar):
+            self.set_counter_mode(ch)
+            self.latch(ch)
+            v = self.read_u32(bar, offset)
+            pass
+        if v & 0x80000000:
+            v -= 0x100000000
+            pass
+        return v
+
+    
     def get_status(self, ch=1):
         """
         Compatibility: PencGetStatus function in GPG-6204 driver
@@ -2,12 +2,28 @@
 import struct
 import time
 from . import core
+from . import registry
 
 
 class InvalidChannelError(Exception):
     pass
 
 
+ppmc_status_flags = (('OBF', 'IBF', 'BUSY', '', 'INTS', 'INTE', 'IST', 'ERR'),)
+ppmc_status_map = core.compile_flag_map(ppmc_status_flags)
+ppmc_status_obf = 0x01
+ppmc_status_ibf = 0x02
+ppmc_status_busy = 0x04
+ppmc_status_ist = 0x40
+
+ppmc_limit_flags = (('FHL', 'FL', 'BHL', 'BL', 'ORG', 'ALM', 'RUN', ''),)
+ppmc_limit_map = core.compile_flag_map(ppmc_limit_flags)
+
+limit_flags = (('+SD', '-SD', '+EL', '-EL', '', 'ORG', 'ALM', ''),)
+limit_map = core.compile_flag_map(limit_flags)
+
+
+@registry.register_driver(7204)
 class pci7204_driver(core.interface_driver):
     bit_flags_in = (
         (
@@ -108,15 +124,27 @@ class pci7204_driver(core.interface_driver):
     )
     
 
+    # PPMC data and command ports of axis 1 and 2
+    write_through = ((1, 0x00), (1, 0x01), (2, 0x00), (2, 0x01))
+    
+    # interlock and limit configuration. the PPMC ports (0x00, 0x01) are
+    # left out: the handshake needs live status and data reads pop a FIFO.
+    batch_windows = ((0, 0x05, 0x08), (1, 0x08, 0x10), (2, 0x08, 0x10))
+    
+    # limit logic/mask and pulse output mode of axis 1 and 2
+    idempotent_registers = ((1, 0x08), (1, 0x09), (1, 0x0a),
+                            (2, 0x08), (2, 0x09), (2, 0x0a))
+
     soft_inter_lock = [True, True]
     base_clock = ['CLOCK_1_16M', 'CLOCK_1_16M']
     motion_config = [{'JOG': {}, 'PTP': {}},
                      {'JOG': {}, 'PTP': {}}]
     
     
+    board_id_register = (0, 0x07)
+    
     def get_board_id(self):
-        bar = 0
-        offset = 0x07
+        bar, offset = self.board_id_register
         size = 1
         
         ret = self.read(bar, offset, size)
@@ -151,17 +179,9 @@ class pci7204_driver(core.interface_driver):
         offset = 0x00
         size = 1
         
-        t0 = time.time()
-        while (time.time() - t0) < timeout:
-            if self.ppmc_is_readable(axis):
-                break
-            time.sleep(0.001)
-            continue
-        else:
-            raise Exception('PPMC data register is busy')
-
-        d = self.read(bar, offset, size)
-        return d
+        d = self.ppmc_read_data_raw(axis, timeout)
+        flag, flag_map = self._get_flag_slice('in', bar, offset, size)
+        return core.flagged_bytes(core._byte_table[d], flag, flag_map=flag_map)
 
     def ppmc_read_status(self, axis=1):
         self._verify_axis_num(axis)
@@ -170,8 +190,26 @@ class pci7204_driver(core.interface_driver):
         size = 1
         
         d = self.read(bar, offset, size)
-        d.set_flag([['OBF', 'IBF', 'BUSY', '', 'INTS', 'INTE', 'IST', 'ERR']])
+        d.set_flag(ppmc_status_flags, ppmc_status_map)
         return d
+    
+    def ppmc_read_status_raw(self, axis=1):
+        self._verify_axis_num(axis)
+        return self.read_u8(axis, 0x01)
+    
+    def ppmc_read_data_raw(self, axis=1, timeout=0.5):
+        self._verify_axis_num(axis)
+        
+        t0 = time.time()
+        while (time.time() - t0) < timeout:
+            if self.ppmc_is_readable(axis):
+                break
+            time.sleep(0.001)
+            continue
+        else:
+            raise Exception('PPMC data register is busy')
+        
+        return self.read_u8(axis, 0x00)
         
     def ppmc_write_data(self, data, axis=1, timeout=0.5):
         self._verify_axis_num(axis)
@@ -216,84 +254,98 @@ class pci7204_driver(core.interface_driver):
         return
         
     def ppmc_is_readable(self, axis):
-        status = self.ppmc_read_status(axis)
-        return bool(status['OBF'])
+        status = self.ppmc_read_status_raw(axis)
+        return bool(status & ppmc_status_obf)
 
     def ppmc_is_writable(self, axis):
-        status = self.ppmc_read_status(axis)
-        return not status['IBF']
+        status = self.ppmc_read_status_raw(axis)
+        return not status & ppmc_status_ibf
         
     def ppmc_is_command_ready(self, axis):
-        status = self.ppmc_read_status(axis)
-        return not status['IST']
+        status = self.ppmc_read_status_raw(axis)
+        return not status & ppmc_status_ist
         
     def ppmc_is_busy(self, axis):
-        status = self.ppmc_read_status(axis)
-        return bool(status['BUSY'])
+        status = self.ppmc_read_status_raw(axis)
+        return bool(status & ppmc_status_busy)
         
     def ppmc_get_stop_status(self, axis=1):
         cmd = 0b01000000
         
-        self.ppmc_write_command(cmd, axis)
-        ret = self.ppmc_read_data(axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            ret = self.ppmc_read_data(axis)
+            pass
         return ret
     
     def ppmc_get_error(self, axis=1):
         cmd = 0b01000001
         
-        self.ppmc_write_command(cmd, axis)
-        ret = self.ppmc_read_data(axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            ret = self.ppmc_read_data(axis)
+            pass
         return ret
         
     def ppmc_get_counter(self, axis=1):
         cmd = 0b01000010
         
-        self.ppmc_write_command(cmd, axis)
-        ret = b''
-        ret += self.ppmc_read_data(axis).bytes
-        ret += self.ppmc_read_data(axis).bytes
-        ret += self.ppmc_read_data(axis).bytes
-        iret = int.from_bytes(ret, 'little')
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            iret = self.ppmc_read_data_raw(axis)
+            iret |= self.ppmc_read_data_raw(axis) << 8
+            iret |= self.ppmc_read_data_raw(axis) << 16
+            pass
         return iret
         
     def ppmc_set_counter(self, count, axis=1):
         cmd = 0b01000011
         
-        self.ppmc_write_command(cmd, axis)
-        
-        ct = struct.pack('<I', count)
-        self.ppmc_write_data(ct[0], axis)
-        self.ppmc_write_data(ct[1], axis)
-        self.ppmc_write_data(ct[2], axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            
+            ct = struct.pack('<I', count)
+            self.ppmc_write_data(ct[0], axis)
+            self.ppmc_write_data(ct[1], axis)
+            self.ppmc_write_data(ct[2], axis)
+            pass
         return
         
     def ppmc_get_limit_status(self, axis=1):
         cmd = 0b01000110
         
-        self.ppmc_write_command(cmd, axis)
-        ret = self.ppmc_read_data(axis)
-        ret.set_flag([['FHL', 'FL', 'BHL', 'BL', 'ORG', 'ALM', 'RUN', '']])
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            ret = self.ppmc_read_data(axis)
+            ret.set_flag(ppmc_limit_flags, ppmc_limit_map)
+            pass
         return ret        
     
     def ppmc_get_aux_in(self, axis=1):
         cmd = 0b01000100
         
-        self.ppmc_write_command(cmd, axis)
-        ret = self.ppmc_read_data(axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            ret = self.ppmc_read_data(axis)
+            pass
         return ret
         
     def ppmc_set_aux_out(self, data, axis=1):
         cmd = 0b01000101
         
-        self.ppmc_write_command(cmd, axis)
-        self.ppmc_write_data(data, axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            self.ppmc_write_data(data, axis)
+            pass
         return
         
     def ppmc_get_input_status(self, axis=1):
         cmd = 0b01000110
         
-        self.ppmc_write_command(cmd, axis)
-        ret = self.ppmc_read_data(axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            ret = self.ppmc_read_data(axis)
+            pass
         return ret
         
     def ppmc_init(self, clock='1/16 MHz', method='linear', 
@@ -344,35 +396,39 @@ class pci7204_driver(core.interface_driver):
         
         
         cmd |= cl | me
-        self.ppmc_write_command(cmd, axis)
-        
-        rl = struct.pack('<H', rate_low)
-        rh = struct.pack('<H', rate_high)
-        pa = struct.pack('<H', acc_pulse)
-        self.ppmc_write_data(rl[0], axis)
-        self.ppmc_write_data(rl[1], axis)
-        self.ppmc_write_data(rh[0], axis)
-        self.ppmc_write_data(rh[1], axis)
-        self.ppmc_write_data(pa[0], axis)
-        self.ppmc_write_data(pa[1], axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            
+            rl = struct.pack('<H', rate_low)
+            rh = struct.pack('<H', rate_high)
+            pa = struct.pack('<H', acc_pulse)
+            self.ppmc_write_data(rl[0], axis)
+            self.ppmc_write_data(rl[1], axis)
+            self.ppmc_write_data(rh[0], axis)
+            self.ppmc_write_data(rh[1], axis)
+            self.ppmc_write_data(pa[0], axis)
+            self.ppmc_write_data(pa[1], axis)
+            pass
         return
         
     def ppmc_stop(self, axis=1):
         cmd = 0b10000000
         
-        if self.ppmc_is_busy(axis):
-            self.ppmc_write_command(cmd, axis)
-            return
-            
+        with self.locked(axis):
+            if self.ppmc_is_busy(axis):
+                self.ppmc_write_command(cmd, axis)
+                return
+            pass
         return
         
     def ppmc_stop_smooth(self, axis=1):
         cmd = 0b10000001
         
-        if self.ppmc_is_busy(axis):
-            self.ppmc_write_command(cmd, axis)
-            return
-        
+        with self.locked(axis):
+            if self.ppmc_is_busy(axis):
+                self.ppmc_write_command(cmd, axis)
+                return
+            pass
         return
     
     def ppmc_move_single_step(self, direction='cw', axis=1):
@@ -389,10 +445,11 @@ class pci7204_driver(core.interface_driver):
             
         cmd |= dir_
         
-        if not self.ppmc_is_busy(axis):
-            self.ppmc_write_command(cmd, axis)
+        with self.locked(axis):
+            if not self.ppmc_is_busy(axis):
+                self.ppmc_write_command(cmd, axis)
+                pass
             pass
-            
         return
         
     def ppmc_move(self, direction='cw', move_pulse=10, axis=1):
@@ -408,12 +465,14 @@ class pci7204_driver(core.interface_driver):
             raise TypeError(msg)
         
         cmd |= dir_
-        self.ppmc_write_command(cmd, axis)
-                
-        pulse = struct.pack('<I', move_pulse)
-        self.ppmc_write_data(pulse[0], axis)
-        self.ppmc_write_data(pulse[1], axis)
-        self.ppmc_write_data(pulse[2], axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            
+            pulse = struct.pack('<I', move_pulse)
+            self.ppmc_write_data(pulse[0], axis)
+            self.ppmc_write_data(pulse[1], axis)
+            self.ppmc_write_data(pulse[2], axis)
+            pass
         return
         
     def ppmc_cont_move(self, pulse_rate, direction='cw', axis=1):
@@ -431,11 +490,13 @@ class pci7204_driver(core.interface_driver):
             raise TypeError(msg)
         
         cmd |= dir_
-        self.ppmc_write_command(cmd, axis)
-        
-        pl = struct.pack('<H', pulse_rate)
-        self.ppmc_write_data(pl[0], axis)
-        self.ppmc_write_data(pl[1], axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            
+            pl = struct.pack('<H', pulse_rate)
+            self.ppmc_write_data(pl[0], axis)
+            self.ppmc_write_data(pl[1], axis)
+            pass
         return
         
     def ppmc_set_speed(self, pulse_rate, axis=1):
@@ -448,11 +509,13 @@ class pci7204_driver(core.interface_driver):
             msg += ', not {0}'.format(hex(pulse_rate))
             raise TypeError(msg)
         
-        self.ppmc_write_command(cmd, axis)
-        
-        pa = struct.pack('<H', pulse_rate)
-        self.ppmc_write_data(pa[0], axis)
-        self.ppmc_write_data(pa[1], axis)
+        with self.locked(axis):
+            self.ppmc_write_command(cmd, axis)
+            
+            pa = struct.pack('<H', pulse_rate)
+            self.ppmc_write_data(pa[0], axis)
+            self.ppmc_write_data(pa[1], axis)
+            pass
         return
         
         
@@ -709,7 +772,7 @@ class pci7204_driver(core.interface_driver):
         alm = lstatus['ALM']
         lstatus2_bytes = core.list2bytes([sdp, sdm, elp, elm, 0, org, alm, 0])
         lstatus2_fb = core.flagged_bytes(lstatus2_bytes)
-        lstatus2_fb.set_flag([['+SD', '-SD', '+EL', '-EL', '', 'ORG', 'ALM', '']])
+        lstatus2_fb.set_flag(limit_flags, limit_map)
         
         status = {'busy': busy,
                   'interlock': ilock,
@@ -0,0 +1,108 @@
+"""
+Driver registry: board model number -> driver class.
+
+Drivers register themselves with a decorator:
+
+    >>> from pyinterface import core, registry
+    >>> @registry.register_driver(2746)
+    ... class pci2746_driver(core.interface_driver):
+    ...     ...
+
+The driver should set board_id_register = (bar, offset) of its board ID
+switch, so that pyinterface.open() can find the cards with one read each;
+without it, a driver is built for every card and its get_board_id()
+(returning the ID as a hex digit string) is used.
+
+The bundled driver modules are imported on first use of their model.
+A driver registered for a bundled model in any other module takes
+precedence over the bundled one, whichever is imported first. Drivers
+in other packages can be registered without importing them, as
+entry points in the 'pyinterface.drivers' group named after the model:
+
+    # setup.py of the plugin package
+    entry_points={
+        'pyinterface.drivers': ['2746 = mysite.pci2746:pci2746_driver'],
+    }
+"""
+
+import importlib
+
+
+entry_point_group = 'pyinterface.drivers'
+
+# bundled drivers: model -> module (the module registers the class)
+builtin_modules = {
+    2702: 'pci2702',
+    2724: 'pci2724',
+    6204: 'pci6204',
+    7204: 'pci7204',
+}
+
+drivers = {}
+
+_entry_points = None
+
+
+class DriverNotFoundError(Exception):
+    pass
+
+
+def register_driver(model):
+    """Class decorator registering a driver for board `model`."""
+    def register(cls):
+        bundled = builtin_modules.get(model)
+        if cls.__module__ == '{0}.{1}'.format(__package__, bundled):
+            # a site driver for the same model wins over the bundled one
+            drivers.setdefault(model, cls)
+        else:
+            drivers[model] = cls
+            pass
+        return cls
+    return register
+
+def get_entry_points():
+    """Return {model: entry point} of the installed plugin drivers."""
+    global _entry_points
+    if _entry_points is None:
+        from importlib import metadata
+        eps = metadata.entry_points()
+        if hasattr(eps, 'select'):
+            eps = eps.select(group=entry_point_group)
+        else:
+            eps = eps.get(entry_point_group, ())
+            pass
+        _entry_points = {}
+        for ep in eps:
+            try:
+                _entry_points[int(ep.name)] = ep
+            except ValueError:
+                pass
+            continue
+        pass
+    return _entry_points
+
+def get_driver_class(model):
+    """Return the driver class of board `model`, importing it if needed."""
+    cls = drivers.get(model)
+    if cls is not None:
+        return cls
+
+    if model in builtin_modules:
+        importlib.import_module('.' + builtin_modules[model], __package__)
+        return drivers[model]
+
+    ep = get_entry_points().get(model)
+    if ep is None:
+        msg = 'no driver is registered for board {0}'.format(model)
+        raise DriverNotFoundError(msg)
+    cls = ep.load()
+    drivers.setdefault(model, cls)
+    return drivers[model]
+
+def has_driver(model):
+    return (model in drivers) or (model in builtin_modules) \
+        or (model in get_entry_points())
+
+def get_models():
+    """Return the sorted model numbers of all known drivers."""
+    return sorted(set(drivers) | set(builtin_modules) | set(get_entry_points()))
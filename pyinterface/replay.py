@@ -0,0 +1,206 @@
+"""
+Record and replay of register sessions.
+
+recording_backend wraps another backend (usually the pypci backend on a
+test rig) and records every lspci/read/write in order. The session is
+saved as JSON and replayed with replay_backend, which serves the recorded
+reads back in order and checks that the writes match, so high-level
+driver methods can be run, timed and counted in CI without hardware.
+
+    >>> rec = replay.recording_backend(backend.get_default_backend())
+    >>> b = pyinterface.open(7204, 0, backend=rec)
+    >>> b.start_motion('PTP')
+    >>> rec.save('ptp_move.json')
+
+    >>> rep = replay.replay_backend('ptp_move.json')
+    >>> b = pyinterface.open(7204, 0, backend=rep)
+    >>> b.start_motion('PTP')
+    >>> rep.finish()
+
+Boards must be opened through the backend's lspci() (as tools.open
+does), so that accesses can be tied to a board and BAR.
+"""
+
+import json
+
+from .backend import backend
+
+
+version = 1
+
+
+class ReplayMismatchError(Exception):
+    pass
+
+
+class recording_backend(backend):
+    thread_safe = False
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.ops = []
+        self.reads = 0
+        self.writes = 0
+        self._bars = {}
+        self._nboards = 0
+        pass
+
+    def _bar_key(self, bar):
+        try:
+            return self._bars[id(bar)][1]
+        except KeyError:
+            msg = '{0} was not obtained from lspci() of this backend'.format(bar)
+            raise ReplayMismatchError(msg)
+
+    def lspci(self, vendor_id, device_id):
+        configs = self.inner.lspci(vendor_id, device_id)
+        boards = []
+        for config in configs:
+            board = self._nboards
+            self._nboards += 1
+            for i, bar in enumerate(config.bar):
+                # keep a reference so that id() stays unique
+                self._bars[id(bar)] = (bar, (board, i))
+                continue
+            boards.append([board, [bar.size for bar in config.bar]])
+            continue
+        self.ops.append(['lspci', vendor_id, device_id, boards])
+        return configs
+
+    def read(self, bar, offset, size):
+        ret = self.inner.read(bar, offset, size)
+        board, i = self._bar_key(bar)
+        self.ops.append(['r', board, i, offset, bytes(ret).hex()])
+        self.reads += 1
+        return ret
+
+    def write(self, bar, offset, data):
+        self.inner.write(bar, offset, data)
+        board, i = self._bar_key(bar)
+        self.ops.append(['w', board, i, offset, bytes(data).hex()])
+        self.writes += 1
+        return
+
+    def read_into(self, bar, offset, buf):
+        self.inner.read_into(bar, offset, buf)
+        board, i = self._bar_key(bar)
+        self.ops.append(['r', board, i, offset, bytes(buf).hex()])
+        self.reads += 1
+        return
+
+    def write_many(self, bar, chunks):
+        chunks = list(chunks)
+        self.inner.write_many(bar, chunks)
+        board, i = self._bar_key(bar)
+        for offset, data in chunks:
+            self.ops.append(['w', board, i, offset, bytes(data).hex()])
+            self.writes += 1
+            continue
+        return
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'version': version, 'ops': self.ops}, f)
+            pass
+        return
+
+
+class replay_bar(object):
+    def __init__(self, board, index, size):
+        self.board = board
+        self.index = index
+        self.size = size
+        pass
+
+    def __repr__(self):
+        return '<replay_bar board={0} bar={1}>'.format(self.board, self.index)
+
+
+class replay_config(object):
+    def __init__(self, board, bar_sizes):
+        self.board = board
+        self.bar = [replay_bar(board, i, size) for i, size in enumerate(bar_sizes)]
+        pass
+
+
+class replay_backend(backend):
+    """Serve a recorded session.
+
+    Parameters
+    ----------
+    session : str or list
+        Path of a file saved by recording_backend.save(), or its op list.
+    """
+    thread_safe = False
+
+    def __init__(self, session):
+        if isinstance(session, str):
+            with open(session) as f:
+                d = json.load(f)
+                pass
+            if d.get('version') != version:
+                msg = 'session version {0} is not supported'.format(d.get('version'))
+                raise ReplayMismatchError(msg)
+            session = d['ops']
+            pass
+
+        self.ops = session
+        self.position = 0
+        self.reads = 0
+        self.writes = 0
+        pass
+
+    def _next(self, kind, actual):
+        if self.position >= len(self.ops):
+            msg = 'unexpected {0} after the end of the session'.format(actual)
+            raise ReplayMismatchError(msg)
+
+        op = self.ops[self.position]
+        if op[0] != kind:
+            msg = 'op #{0}: expected {1}, got {2}'.format(self.position, op,
+                                                          actual)
+            raise ReplayMismatchError(msg)
+
+        self.position += 1
+        return op
+
+    def lspci(self, vendor_id, device_id):
+        op = self._next('lspci', ['lspci', vendor_id, device_id])
+        if (op[1], op[2]) != (vendor_id, device_id):
+            msg = 'op #{0}: expected {1}, got lspci({2}, {3})'.format(
+                self.position-1, op[:3], vendor_id, device_id)
+            raise ReplayMismatchError(msg)
+        return [replay_config(board, sizes) for board, sizes in op[3]]
+
+    def read(self, bar, offset, size):
+        actual = ['r', bar.board, bar.index, offset, size]
+        op = self._next('r', actual)
+        data = bytes.fromhex(op[4])
+        if (op[1], op[2], op[3], len(data)) != (bar.board, bar.index, offset, size):
+            msg = 'op #{0}: expected {1}, got {2}'.format(self.position-1,
+                                                          op, actual)
+            raise ReplayMismatchError(msg)
+        self.reads += 1
+        return data
+
+    def write(self, bar, offset, data):
+        actual = ['w', bar.board, bar.index, offset, bytes(data).hex()]
+        op = self._next('w', actual)
+        if op != actual:
+            msg = 'op #{0}: expected {1}, got {2}'.format(self.position-1,
+                                                          op, actual)
+            raise ReplayMismatchError(msg)
+        self.writes += 1
+        return
+
+    def read_into(self, bar, offset, buf):
+        buf[:] = self.read(bar, offset, len(buf))
+        return
+
+    def finish(self):
+        """Check that the whole session has been replayed."""
+        if self.position != len(self.ops):
+            msg = '{0} of {1} ops were not replayed'.format(
+                len(self.ops) - self.position, len(self.ops))
+            raise ReplayMismatchError(msg)
+        return
@@ -0,0 +1,279 @@
+"""
+Periodic acquisition of the digital inputs of PCI-2724 / PCI-2702.
+
+dio_sampler reads all inputs of a board in one register access at a
+fixed rate in a background thread. Sampling instants follow an absolute
+schedule (t0 + k * period), so the rate does not drift with the time
+spent in Python; the thread sleeps until shortly before each deadline
+and spins for the rest. A deadline missed by more than one period is
+counted as an overrun and skipped.
+
+Samples are stored with their time.monotonic_ns() timestamps in
+preallocated numpy arrays used as a ring buffer. Each sample is stored
+twice (at i and i + capacity), so any run of up to `capacity` recent
+samples is one contiguous slice and is returned without copying:
+
+    >>> s = sampler.dio_sampler(board, rate=1000)
+    >>> s.start()
+    >>> pos = 0
+    >>> ts, values, pos = s.since(pos)    # new samples since pos
+    >>> ts, values = s.latest(100)        # the last 100 samples
+    >>> s.stop()
+    >>> s.stats()
+
+The returned arrays are views of the ring buffer; copy them if they are
+kept for longer than capacity / rate seconds.
+
+dio_sampler requires numpy (pip install pyinterface[numpy]).
+
+With clock='timer', the samples are paced by the interval timer of the
+board instead (set_timer() / wait_timer_tick()): the thread waits for
+the timer status and reads the inputs at each tick, so the period follows
+the board clock. The timer encoding must be given first with
+board.configure_timer(). The rate is rounded to a period the timer can produce
+(see the `rate` attribute), and the jitter statistics are the deviations
+of the sampling intervals from that period.
+"""
+
+import threading
+import time
+
+from . import core
+
+
+_monotonic_ns = time.monotonic_ns
+
+
+class dio_sampler(object):
+    """Sample the inputs of a board at `rate` [Hz].
+
+    Parameters
+    ----------
+    board : pci2724_driver or pci2702_driver
+    rate : float
+        Sampling rate [Hz].
+    capacity : int
+        Number of samples kept in the ring buffer.
+    clock : str
+        'software' to pace the samples with time.monotonic_ns(), or
+        'timer' to pace them with the interval timer of the board,
+        which must be set up with configure_timer().
+    """
+
+    # [ns] before a deadline at which sleeping stops and spinning starts
+    spin_ns = 200000
+
+    def __init__(self, board, rate, capacity=65536, clock='software'):
+        np = core._get_numpy('dio_sampler')
+        if clock not in ('software', 'timer'):
+            raise ValueError("clock must be 'software' or 'timer', not {0!r}".format(clock))
+
+        self.board = board
+        self.clock = clock
+        if clock == 'timer':
+            rate = 1.0 / board.set_timer(1.0 / rate)
+            pass
+        self.rate = rate
+        self.period_ns = int(round(1e9 / rate))
+        self.capacity = capacity
+        self.nbytes = board.io_number // 8
+
+        dtype = '<u4' if self.nbytes == 4 else '<u8'
+        self._values = np.zeros(2 * capacity, dtype=dtype)
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+
+        self.count = 0
+        self.overruns = 0
+        self._late_sum = 0
+        self._late_sq = 0
+        self._late_max = 0
+        self._thread = None
+        self._stop = threading.Event()
+        pass
+
+    def _get_reader(self):
+        board = self.board
+        if self.nbytes == 4:
+            return lambda: board.read_u32(0, 0x00)
+        return lambda: board.read_u64(0, 0x00)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        run = self._run_timer if self.clock == 'timer' else self._run
+        self._thread = threading.Thread(target=run, daemon=True,
+                                        name='dio_sampler')
+        self._thread.start()
+        return
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return
+
+    def _run(self):
+        read = self._get_reader()
+        values = self._values
+        timestamps = self._timestamps
+        cap = self.capacity
+        period = self.period_ns
+        spin = self.spin_ns
+        stop = self._stop
+        now = _monotonic_ns
+
+        deadline = now()
+        while not stop.is_set():
+            remaining = deadline - now()
+            if remaining > spin:
+                # returns at once when stop() is called
+                if stop.wait((remaining - spin) * 1e-9):
+                    break
+                pass
+            while now() < deadline:
+                continue
+
+            t = now()
+            v = read()
+
+            i = self.count % cap
+            timestamps[i] = t
+            timestamps[i + cap] = t
+            values[i] = v
+            values[i + cap] = v
+            self.count += 1
+
+            late = t - deadline
+            self._late_sum += late
+            self._late_sq += late * late
+            if late > self._late_max:
+                self._late_max = late
+                pass
+
+            deadline += period
+            missed = (now() - deadline) // period
+            if missed > 0:
+                self.overruns += missed
+                deadline += missed * period
+                pass
+            continue
+        return
+
+    def _run_timer(self):
+        read = self._get_reader()
+        wait = self.board.wait_timer_tick
+        values = self._values
+        timestamps = self._timestamps
+        cap = self.capacity
+        period = self.period_ns
+        stop = self._stop
+        now = _monotonic_ns
+        # wake up now and then to see the stop request
+        timeout = max(period * 1e-9 * 2, 0.1)
+
+        self.board.start_timer()
+        try:
+            prev = None
+            while not stop.is_set():
+                try:
+                    wait(timeout)
+                except TimeoutError:
+                    continue
+
+                t = now()
+                v = read()
+
+                i = self.count % cap
+                timestamps[i] = t
+                timestamps[i + cap] = t
+                values[i] = v
+                values[i + cap] = v
+                self.count += 1
+
+                if prev is not None:
+                    # ticks since the previous sample; more than one is
+                    # an overrun
+                    ticks = max((t - prev + period // 2) // period, 1)
+                    self.overruns += ticks - 1
+                    late = t - prev - ticks * period
+                    self._late_sum += late
+                    self._late_sq += late * late
+                    if abs(late) > self._late_max:
+                        self._late_max = abs(late)
+                        pass
+                    pass
+                prev = t
+                continue
+        finally:
+            self.board.stop_timer()
+            pass
+        return
+
+    def _window(self, start, stop):
+        # absolute sample numbers [start, stop) -> contiguous views
+        i = start % self.capacity
+        j = i + (stop - start)
+        return self._timestamps[i:j], self._values[i:j]
+
+    def latest(self, n=None):
+        """Return (timestamps, values) of the last `n` samples (views)."""
+        count = self.count
+        n = min(count, self.capacity) if n is None else min(n, count, self.capacity)
+        return self._window(count - n, count)
+
+    def since(self, pos):
+        """Return (timestamps, values, next pos) of the samples taken since
+        sample number `pos`.
+
+        Samples already overwritten are skipped; compare next pos - pos
+        with the length of the arrays to detect them.
+        """
+        count = self.count
+        start = max(pos, count - self.capacity)
+        ts, values = self._window(start, count)
+        return ts, values, count
+
+    def to_bits(self, values):
+        """Unpack samples into a (n, io_number) array of bits (IN1 first)."""
+        np = core._get_numpy('dio_sampler')
+        b = np.ascontiguousarray(values).view(np.uint8).reshape(-1, self.nbytes)
+        return np.unpackbits(b, axis=1, bitorder='little')
+
+    def stats(self):
+        """Return a dict with the sample count, overruns, the achieved rate
+        and the lateness of the samples behind their deadlines [ns]
+        ('jitter_mean', 'jitter_std', 'jitter_max').
+
+        With clock='timer', the lateness is the deviation of each sampling
+        interval from the timer period (signed; jitter_max is the largest
+        absolute deviation)."""
+        n = self.count
+        ret = {'samples': n, 'overruns': self.overruns, 'rate': 0.0,
+               'jitter_mean': 0.0, 'jitter_std': 0.0, 'jitter_max': 0}
+        if n == 0:
+            return ret
+
+        ts, _ = self.latest()
+        if len(ts) > 1:
+            ret['rate'] = (len(ts) - 1) * 1e9 / int(ts[-1] - ts[0])
+            pass
+        # intervals are measured from the second sample on in timer mode
+        m = n - 1 if self.clock == 'timer' else n
+        if m == 0:
+            return ret
+        mean = self._late_sum / m
+        ret['jitter_mean'] = mean
+        ret['jitter_std'] = max(self._late_sq / m - mean * mean, 0.0) ** 0.5
+        ret['jitter_max'] = self._late_max
+        return ret
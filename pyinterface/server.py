@@ -0,0 +1,424 @@
+"""
+Board server.
+
+pyinterface-server opens boards once and serves their registers to
+local clients over a Unix domain socket, so that many processes can share
+the boards without root privileges. Clients use client.remote_backend,
+on which every driver works unchanged:
+
+    $ pyinterface-server --board 2724:0 --board 7204:1
+
+    >>> from pyinterface import client
+    >>> b = pyinterface.open(2724, 0, backend=client.remote_backend())
+
+Requests of all clients are queued and executed in ticks. Within a tick,
+reads of the same register are served by one hardware read when the
+register lies in the `batch_windows` of its driver (registers without
+read side effects); a write to a bar ends the merging for that bar.
+
+The server keeps the output registers of the boards (log_bytes_out of
+its drivers): MODIFY applies (current & ~clear) ^ xor to them, so the
+read-modify-writes of the clients do not overwrite each other. LOCK
+gives a bar to one client (and holds interface_driver.locked() of the
+bar) until the matching UNLOCK or until the client disconnects; requests
+of other clients for that bar wait meanwhile. Locks are reentrant.
+
+Protocol (little endian)
+------------------------
+request : op (u8), board (u8), bar (u8), offset (u16), size (u16),
+          followed by `size` bytes of data for WRITE, or by `size` bytes
+          of clear mask and `size` bytes of xor mask for MODIFY
+reply   : status (u8, 0 = ok), length (u16), followed by `length` bytes
+          (read data, new value for MODIFY, LSPCI result, or an utf-8
+          error message)
+
+Access control
+--------------
+The server gives raw register access, so the socket is created with mode
+0o660 and, with --group, owned by that group; add the users who may use
+the boards to the group. The socket directory (default /run/pyinterface)
+is created if missing and must not be writable by other users.
+
+LSPCI puts the vendor id in `offset` and the device id in `size`; its
+result is the number of boards (u8), then for each board its index (u8),
+the number of bars (u8) and the bar sizes (u16 each).
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import grp
+import os
+import signal
+import stat
+import struct
+
+from .client import (LSPCI, READ, WRITE, LOCK, UNLOCK, MODIFY, OK, ERROR,
+                     request, reply, default_socket)
+
+
+# internal op: release the locks of a disconnected client
+_DISCONNECT = -1
+
+
+class UnsafeSocketPathError(Exception):
+    pass
+
+
+class board_server(object):
+    """Serve the registers of opened drivers.
+
+    Parameters
+    ----------
+    boards : list of interface_driver
+    path : str
+        Path of the Unix domain socket.
+    tick : float
+        [s] to wait for more requests before executing a batch. 0 executes
+        whatever has arrived when the server gets to run.
+    """
+
+    def __init__(self, boards, path=default_socket, tick=0.0):
+        self.boards = list(boards)
+        self.path = path
+        self.tick = tick
+        self.requests = 0
+        self.hw_reads = 0
+        self.hw_writes = 0
+        self.merged_reads = 0
+        self._mergeable = [self._mergeable_registers(b) for b in self.boards]
+        self._executor = concurrent.futures.ThreadPoolExecutor(1)
+        self._queue = None
+        self._server = None
+        # (board, bar) -> [client, depth] of locked bars
+        self._owners = {}
+        # (board, bar) -> queue items waiting for the lock
+        self._waiting = {}
+        pass
+
+    @staticmethod
+    def _mergeable_registers(board):
+        ret = set()
+        for bar_num, start, end in type(board).batch_windows:
+            ret.update((bar_num, o) for o in range(start, end))
+            continue
+        return ret
+
+    def _lspci(self, vendor_id, device_id):
+        from .tools import interface_vendor_id
+
+        found = [(i, b) for i, b in enumerate(self.boards)
+                 if (vendor_id == interface_vendor_id)
+                 and (b.config.device_id == device_id)]
+        ret = bytearray([len(found)])
+        for i, b in found:
+            ret += bytes([i, len(b.bar)])
+            for bar in b.bar:
+                ret += struct.pack('<H', bar.size)
+                continue
+            continue
+        return bytes(ret)
+
+    def _is_mergeable(self, board, bar_num, offset, size):
+        regs = self._mergeable[board]
+        for o in range(offset, offset + size):
+            if (bar_num, o) not in regs:
+                return False
+            continue
+        return True
+
+    def _execute(self, batch):
+        # runs in the I/O thread; returns (status, payload) per request
+        results = []
+        cache = {}
+        for op, board, bar_num, offset, size, data in batch:
+            try:
+                b = self.boards[board]
+                bar = b.bar[bar_num]
+                if op in (READ, WRITE, MODIFY) and offset + size > bar.size:
+                    msg = 'access 0x{0:x}-0x{1:x} is out of bar{2}'.format(
+                        offset, offset+size-1, bar_num)
+                    results.append((ERROR, msg.encode()))
+                    continue
+                if op == READ:
+                    key = (board, bar_num, offset, size)
+                    ret = cache.get(key)
+                    if ret is not None:
+                        self.merged_reads += 1
+                    else:
+                        ret = bytes(b._read_raw(bar_num, offset, size))
+                        self.hw_reads += 1
+                        if self._is_mergeable(board, bar_num, offset, size):
+                            cache[key] = ret
+                            pass
+                        pass
+                    results.append((OK, ret))
+                elif op in (WRITE, MODIFY):
+                    if op == WRITE:
+                        b.write(bar_num, offset, data)
+                        ret = b''
+                    else:
+                        ret = bytes(b.modify(bar_num, offset, data[:size],
+                                             data[size:]))
+                        pass
+                    self.hw_writes += 1
+                    for key in [k for k in cache if k[:2] == (board, bar_num)]:
+                        del cache[key]
+                        continue
+                    results.append((OK, ret))
+                elif op == LOCK:
+                    b.locked(bar_num).acquire()
+                    results.append((OK, b''))
+                elif op == UNLOCK:
+                    b.locked(bar_num).release()
+                    results.append((OK, b''))
+                else:
+                    results.append((ERROR, 'unknown op {0}'.format(op).encode()))
+                    pass
+            except Exception as e:
+                results.append((ERROR, '{0}: {1}'.format(type(e).__name__,
+                                                         e).encode()))
+                pass
+            continue
+        return results
+
+    def _admit(self, item):
+        # decide in the event loop which queued requests run now; returns
+        # the items to execute (requests for a bar locked by another
+        # client wait in self._waiting)
+        (op, board, bar_num, offset, size, data), fut, client = item
+        if op == _DISCONNECT:
+            ret = []
+            for key, (owner, depth) in list(self._owners.items()):
+                if owner == client:
+                    ret += [((UNLOCK,) + key + (0, 0, b''), None, client)] * depth
+                    self._release(key)
+                    pass
+                continue
+            return ret
+
+        key = (board, bar_num)
+        owner = self._owners.get(key)
+        if (owner is not None) and (owner[0] != client):
+            self._waiting.setdefault(key, []).append(item)
+            return []
+
+        if op == LOCK:
+            if owner is None:
+                self._owners[key] = [client, 1]
+            else:
+                owner[1] += 1
+                pass
+        elif (op == UNLOCK) and (owner is not None):
+            owner[1] -= 1
+            if owner[1] == 0:
+                self._release(key)
+                pass
+            pass
+        return [item]
+
+    def _release(self, key):
+        del self._owners[key]
+        for item in self._waiting.pop(key, ()):
+            self._queue.put_nowait(item)
+            continue
+        return
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            await asyncio.sleep(self.tick)
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+
+            admitted = []
+            for item in batch:
+                admitted += self._admit(item)
+                continue
+            if not admitted:
+                continue
+
+            reqs = [r for r, fut, client in admitted]
+            results = await loop.run_in_executor(self._executor,
+                                                 self._execute, reqs)
+            for (r, fut, client), res in zip(admitted, results):
+                if (fut is not None) and not fut.cancelled():
+                    fut.set_result(res)
+                    pass
+                continue
+            continue
+
+    async def _serve_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        client = object()
+        try:
+            while True:
+                head = await reader.readexactly(request.size)
+                op, board, bar_num, offset, size = request.unpack(head)
+                self.requests += 1
+
+                if op == LSPCI:
+                    status, payload = OK, self._lspci(offset, size)
+                else:
+                    data = b''
+                    if op == WRITE:
+                        data = await reader.readexactly(size)
+                    elif op == MODIFY:
+                        data = await reader.readexactly(2 * size)
+                        pass
+                    fut = loop.create_future()
+                    self._queue.put_nowait(
+                        ((op, board, bar_num, offset, size, data), fut, client))
+                    status, payload = await fut
+                    pass
+
+                writer.write(reply.pack(status, len(payload)) + payload)
+                await writer.drain()
+                continue
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            if self._queue is not None:
+                self._queue.put_nowait(
+                    ((_DISCONNECT, 0, 0, 0, 0, b''), None, client))
+                pass
+            pass
+        return
+
+    def _prepare_path(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o755, exist_ok=True)
+        st = os.stat(directory)
+        if (st.st_mode & 0o022) or (st.st_uid not in (0, os.getuid())):
+            msg = 'socket directory {0} is writable by other users;'.format(
+                directory)
+            msg += ' use a directory owned by the server user (--socket)'
+            raise UnsafeSocketPathError(msg)
+
+        try:
+            st = os.lstat(self.path)
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(st.st_mode):
+            msg = '{0} exists and is not a socket'.format(self.path)
+            raise UnsafeSocketPathError(msg)
+        # a socket left by a previous server
+        os.unlink(self.path)
+        return
+
+    async def start(self, mode=0o660, group=None):
+        """Start listening; returns once the socket is ready.
+
+        Parameters
+        ----------
+        mode : int
+            Permissions of the socket.
+        group : str, optional
+            Group owning the socket, i.e. the users allowed to connect
+            with mode 0o660.
+        """
+        self._queue = asyncio.Queue()
+        self._prepare_path()
+        # create the socket with `mode` already, not world-accessible
+        # until the chmod
+        umask = os.umask(0o777 & ~mode)
+        try:
+            self._server = await asyncio.start_unix_server(
+                self._serve_client, self.path)
+        finally:
+            os.umask(umask)
+            pass
+        if group is not None:
+            os.chown(self.path, -1, grp.getgrnam(group).gr_gid)
+            pass
+        os.chmod(self.path, mode)
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+        return
+
+    async def serve_forever(self, mode=0o660, group=None):
+        """Serve until cancelled or SIGTERM; removes the socket at exit."""
+        await self.start(mode, group)
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+            self.close()
+            pass
+        return
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._dispatcher.cancel()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+                pass
+            pass
+        return
+
+
+def _parse_board(s):
+    model, board_id = s.split(':')
+    return int(model), int(board_id, 16)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        prog='pyinterface-server',
+        description='Serve Interface PCI boards to local clients.')
+    p.add_argument('--board', action='append', type=_parse_board,
+                   required=True, metavar='MODEL:ID',
+                   help='board to serve, e.g. 2724:0 (repeatable)')
+    p.add_argument('--socket', default=default_socket,
+                   help='path of the Unix socket (default: %(default)s)')
+    p.add_argument('--mode', default='660', type=lambda s: int(s, 8),
+                   help='permissions of the socket (default: %(default)s)')
+    p.add_argument('--group',
+                   help='group owning the socket; its members may use the '
+                   'boards')
+    p.add_argument('--tick', default=0.0, type=float,
+                   help='[s] to collect requests before executing them')
+    p.add_argument('--simulate', action='store_true',
+                   help='serve simulated boards instead of PCI cards')
+    args = p.parse_args(argv)
+
+    from .tools import open
+
+    backend = None
+    if args.simulate:
+        from . import simulator
+        backend = simulator.simulated_backend()
+        for model, board_id in args.board:
+            backend.add_board(simulator.sim_boards[model](board_id=board_id))
+            continue
+        pass
+
+    boards = []
+    for model, board_id in args.board:
+        b = open(model, board_id, backend=backend)
+        if b is None:
+            raise SystemExit('board {0}:{1:X} is not found'.format(model,
+                                                                  board_id))
+        boards.append(b)
+        continue
+
+    server = board_server(boards, args.socket, args.tick)
+    try:
+        asyncio.run(server.serve_forever(args.mode, args.group))
+    except KeyboardInterrupt:
+        pass
+    except UnsafeSocketPathError as e:
+        raise SystemExit(str(e))
+    return
+
+
+if __name__ == '__main__':
+    main()
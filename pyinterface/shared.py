@@ -0,0 +1,269 @@
+"""
+Shadow registers shared between processes.
+
+By default every driver keeps private copies of the registers it has
+read and written (log_bytes_in, log_bytes_out), so a read-modify-write
+such as pci2724_driver.output_point() in one process overwrites output
+bits set by another process. interface_driver.enable_shared_memory()
+moves both logs of a driver into a named multiprocessing.shared_memory
+segment and turns the per-BAR locks into cross-process locks (POSIX
+record locks on the segment, one byte per BAR), so that every process
+opening the same board sees the same shadow registers:
+
+    >>> b = pyinterface.open(2724, 0)
+    >>> b.enable_shared_memory()
+    >>> b.output_point([1], 5)    # keeps the bits set by other processes
+
+The segment outlives the processes using it; call unlink() (or
+disable_shared_memory(unlink=True)) when the board is not used anymore.
+"""
+
+import fcntl
+import mmap
+import os
+import threading
+
+
+# where multiprocessing.shared_memory keeps the segments on Linux
+_shm_dir = '/dev/shm'
+
+
+class SharedMemoryLayoutError(Exception):
+    pass
+
+
+class shared_bar(object):
+    """Register bytes of one BAR in a shared memory segment.
+
+    Supports the bytearray operations the drivers use on log_bytes_in and
+    log_bytes_out; slicing returns a private bytearray copy.
+    """
+    __slots__ = ('view',)
+
+    def __init__(self, view):
+        self.view = view
+        pass
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return bytearray(self.view[key])
+        return self.view[key]
+
+    def __setitem__(self, key, value):
+        self.view[key] = value
+        return
+
+    def __iter__(self):
+        return iter(bytes(self.view))
+
+    def __bytes__(self):
+        return bytes(self.view)
+
+    def __eq__(self, other):
+        return bytes(self.view) == other
+
+    def __repr__(self):
+        return 'shared_bar({0!r})'.format(bytes(self.view))
+
+
+class process_lock(object):
+    """Reentrant lock held by one thread of one process at a time.
+
+    A threading.RLock orders the threads of this process; an exclusive
+    lockf() lock on byte `index` of the segment orders the processes.
+    """
+
+    def __init__(self, fd, index):
+        self.fd = fd
+        self.index = index
+        self._lock = threading.RLock()
+        self._depth = 0
+        pass
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, self.index)
+            except BaseException:
+                self._lock.release()
+                raise
+            pass
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.index)
+            pass
+        self._lock.release()
+        return
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+        return
+
+
+class shared_registers(object):
+    """log_bytes_in / log_bytes_out of a board in shared memory.
+
+    The segment is the file `name` in /dev/shm (the multiprocessing
+    shared_memory segment of that name), created 0o600 by the first
+    process. Its record locks serve as the BAR locks. Use attach(), which
+    returns the instance of this process for `name`: lockf() locks belong
+    to the process, so two instances of one segment in a process would
+    not exclude each other.
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory segment.
+    bar_sizes : list of int
+        Sizes of the BARs of the board.
+    init_in, init_out : list of bytes-like, optional
+        Initial contents when the segment is created by this process.
+    """
+
+    _attached = {}
+    _attached_lock = threading.Lock()
+
+    @classmethod
+    def attach(cls, name, bar_sizes, init_in=None, init_out=None):
+        """Return the shared_registers of this process for `name`.
+
+        Every call must be paired with close().
+        """
+        with cls._attached_lock:
+            sh = cls._attached.get(name)
+            if sh is None:
+                sh = cls(name, bar_sizes, init_in, init_out)
+                cls._attached[name] = sh
+            elif sh.bar_sizes != list(bar_sizes):
+                msg = 'shared memory {0} is attached with bars {1}'.format(
+                    name, sh.bar_sizes)
+                raise SharedMemoryLayoutError(msg)
+            sh.users += 1
+            pass
+        return sh
+
+    def __init__(self, name, bar_sizes, init_in=None, init_out=None):
+        if '/' in name:
+            raise ValueError('invalid segment name {0!r}'.format(name))
+        self.name = name
+        self.bar_sizes = list(bar_sizes)
+        self.users = 0
+        size = 2 * sum(self.bar_sizes)
+
+        # never follow a link planted in /dev/shm, and only use a segment
+        # of our own user: anyone able to lock it could stop the board
+        path = os.path.join(_shm_dir, name)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW,
+                          0o600)
+        st = os.fstat(self.fd)
+        if st.st_uid != os.getuid():
+            os.close(self.fd)
+            msg = '{0} belongs to another user'.format(path)
+            raise SharedMemoryLayoutError(msg)
+        self.locks = [process_lock(self.fd, i)
+                      for i in range(len(self.bar_sizes))]
+
+        # size-or-attach under a lock on the byte after the BAR locks, so
+        # that the segment is initialized once
+        setup = process_lock(self.fd, len(self.bar_sizes))
+        with setup:
+            created = os.fstat(self.fd).st_size == 0
+            if created:
+                os.ftruncate(self.fd, size)
+                pass
+            actual = os.fstat(self.fd).st_size
+            if actual < size:
+                msg = 'shared memory {0} has {1} bytes, {2} are needed'.format(
+                    name, actual, size)
+                pass
+            else:
+                msg = None
+                self.mmap = mmap.mmap(self.fd, size)
+                self._map(created, init_in, init_out)
+                pass
+            pass
+
+        if msg is not None:
+            # after releasing the setup lock: closing the fd drops it
+            os.close(self.fd)
+            raise SharedMemoryLayoutError(msg)
+        return
+
+    @classmethod
+    def _after_fork(cls):
+        # the locks of the parent are not inherited: attach anew
+        cls._attached = {}
+        cls._attached_lock = threading.Lock()
+        return
+
+    def _map(self, created, init_in, init_out):
+        # views of the BARs in the segment; initialized if just created
+        buf = self._buf = memoryview(self.mmap)
+        self.log_bytes_in = []
+        self.log_bytes_out = []
+        pos = 0
+        for logs in (self.log_bytes_in, self.log_bytes_out):
+            for s in self.bar_sizes:
+                logs.append(shared_bar(buf[pos:pos+s]))
+                pos += s
+                continue
+            continue
+
+        if created:
+            for logs, init in ((self.log_bytes_in, init_in),
+                               (self.log_bytes_out, init_out)):
+                for log, d in zip(logs, init or ()):
+                    log[0:len(d)] = d
+                    continue
+                continue
+            pass
+        return
+
+    def close(self):
+        """Detach from the segment; it stays available to others.
+
+        The segment is detached when every attach() has been closed.
+        """
+        with self._attached_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if self._attached.get(self.name) is self:
+                del self._attached[self.name]
+                pass
+            pass
+
+        for logs in (getattr(self, 'log_bytes_in', ()),
+                     getattr(self, 'log_bytes_out', ())):
+            for log in logs:
+                log.view.release()
+                continue
+            continue
+        self.log_bytes_in = []
+        self.log_bytes_out = []
+        self._buf.release()
+        self.mmap.close()
+        os.close(self.fd)
+        return
+
+    def unlink(self):
+        """Remove the segment."""
+        try:
+            os.unlink(os.path.join(_shm_dir, self.name))
+        except FileNotFoundError:
+            pass
+        return
+
+
+os.register_at_fork(after_in_child=shared_registers._after_fork)
@@ -0,0 +1,442 @@
+"""
+In-memory simulated Interface boards.
+
+The simulated boards model the BAR sizes and the register side effects
+that the drivers rely on, so that drivers can be exercised, profiled and
+soak-tested without PCI cards or root privileges.
+
+    >>> import pyinterface
+    >>> from pyinterface import simulator
+    >>> sim = simulator.simulated_backend()
+    >>> dio = sim.add_board(simulator.sim_pci2724(board_id=1))
+    >>> b = pyinterface.open(2724, 1, backend=sim)
+    >>> dio.set_inputs(0x0000000f)
+    >>> b.input_dword_raw()
+    15
+"""
+
+import collections
+import time
+
+from .backend import backend
+
+
+interface_vendor_id = 0x1147
+
+
+class InvalidRegisterAccessError(Exception):
+    pass
+
+
+class sim_bar(object):
+    def __init__(self, board, index, size, addr=0):
+        self.board = board
+        self.index = index
+        self.size = size
+        self.addr = addr
+        pass
+
+    def __repr__(self):
+        return '<sim_bar {0} size=0x{1:x} of {2}>'.format(self.index, self.size,
+                                                          self.board)
+
+
+class sim_config(object):
+    _next_bus = 1
+
+    def __init__(self, board):
+        # each simulated board sits on its own bus, with its own I/O range
+        self.bus = sim_config._next_bus
+        self.device = 0
+        self.function = 0
+        sim_config._next_bus += 1
+
+        self.vendor_id = interface_vendor_id
+        self.device_id = board.model
+        self.board = board
+        self.bar = [sim_bar(board, i, size, addr=(self.bus << 12) | (i << 8))
+                    for i, size in enumerate(board.bar_sizes)]
+        pass
+
+
+class sim_board(object):
+    model = 0
+    bar_sizes = ()
+
+    def __init__(self, board_id=0):
+        self.board_id = board_id
+        self.regs_in = [bytearray(size) for size in self.bar_sizes]
+        self.regs_out = [bytearray(size) for size in self.bar_sizes]
+        self.config = sim_config(self)
+        self.reset()
+        pass
+
+    def __repr__(self):
+        return '<{0} board_id={1}>'.format(self.__class__.__name__,
+                                           self.board_id)
+
+    def reset(self):
+        pass
+
+    def _verify_access(self, bar_num, offset, size):
+        if not (0 <= bar_num < len(self.bar_sizes)):
+            msg = 'bar must be in 0-{0}, not {1}'.format(len(self.bar_sizes)-1,
+                                                         bar_num)
+            raise InvalidRegisterAccessError(msg)
+
+        if (offset < 0) or (offset + size > self.bar_sizes[bar_num]):
+            msg = 'access 0x{0:x}-0x{1:x} is out of bar{2}'.format(
+                offset, offset+size-1, bar_num)
+            msg += ' (size=0x{0:x})'.format(self.bar_sizes[bar_num])
+            raise InvalidRegisterAccessError(msg)
+        return
+
+    def read(self, bar_num, offset, size):
+        self._verify_access(bar_num, offset, size)
+        ret = bytes(self.regs_in[bar_num][offset:offset+size])
+        self.on_read(bar_num, offset, size)
+        return ret
+
+    def write(self, bar_num, offset, data):
+        size = len(data)
+        self._verify_access(bar_num, offset, size)
+        self.regs_out[bar_num][offset:offset+size] = data
+        self.on_write(bar_num, offset, size)
+        return
+
+    def on_read(self, bar_num, offset, size):
+        """Called after a read; update registers with read side effects."""
+        pass
+
+    def on_write(self, bar_num, offset, size):
+        """Called after regs_out is updated by a write."""
+        pass
+
+
+class sim_pci2724(sim_board):
+    """PCI-2724: 32 inputs at 0x00-0x03, 32 outputs at 0x00-0x03.
+    Latch setting (0x0b) reads back, board ID at 0x0f.
+
+    Interval timer: writing SCK1-3 << 4 | TCTRL1-4 to 0x0a runs the timer
+    with a period of timer_clocks[SCK] * TCTRL in wall-clock time (TCTRL
+    = 0 stops it); TCTRL reads back as TD1-4. Each period sets SIGT (bit4)
+    of the status register 0x0c, and writing SIGT to 0x0c clears it.
+    Use the timer with b.configure_timer(sim_pci2724.timer_clocks)."""
+    model = 2724
+    bar_sizes = (0x10,)
+    io_number = 32
+
+    timer_clocks = (10e-6, 100e-6, 1e-3, 10e-3, 100e-3, 1.0)
+
+    def reset(self):
+        self.regs_in[0][0x0f] = self.board_id & 0x0f
+        self.timer_period = 0
+        self.timer_next = 0
+        return
+
+    def read(self, bar_num, offset, size):
+        if self.timer_period and (offset <= 0x0c < offset + size):
+            self._update_timer()
+            pass
+        return super().read(bar_num, offset, size)
+
+    def _update_timer(self):
+        now = time.monotonic_ns()
+        if now < self.timer_next:
+            return
+        self.regs_in[0][0x0c] |= 0x10
+        ticks = (now - self.timer_next) // self.timer_period + 1
+        self.timer_next += ticks * self.timer_period
+        return
+
+    def _write_timer(self):
+        d = self.regs_out[0][0x0a]
+        count = d & 0x0f
+        sck = (d >> 4) & 0x07
+        self.regs_in[0][0x0a] = count
+        if count == 0 or sck >= len(self.timer_clocks):
+            self.timer_period = 0
+            return
+        self.timer_period = int(round(self.timer_clocks[sck] * count * 1e9))
+        self.timer_next = time.monotonic_ns() + self.timer_period
+        return
+
+    def set_inputs(self, value):
+        """Set the state of the input terminals (IN1 = bit0)."""
+        size = self.io_number // 8
+        self.regs_in[0][0:size] = (value & ((1 << self.io_number) - 1)).to_bytes(size, 'little')
+        return
+
+    def get_outputs(self):
+        """Get the state of the output terminals (OUT1 = bit0)."""
+        size = self.io_number // 8
+        return int.from_bytes(self.regs_out[0][0:size], 'little')
+
+    def on_write(self, bar_num, offset, size):
+        if offset <= 0x0a < offset + size:
+            self._write_timer()
+            pass
+        if offset <= 0x0b < offset + size:
+            self.regs_in[0][0x0b] = self.regs_out[0][0x0b]
+            pass
+        if offset <= 0x0c < offset + size:
+            self.regs_in[0][0x0c] &= ~self.regs_out[0][0x0c] & 0xff
+            pass
+        return
+
+
+class sim_pci2702(sim_pci2724):
+    """PCI-2702: 64 inputs at 0x00-0x07, 64 outputs at 0x00-0x07."""
+    model = 2702
+    io_number = 64
+
+
+class sim_pci6204(sim_board):
+    """PCI-6204: two 32-bit encoder counters (ch1 at 0x00, ch2 at 0x10).
+
+    - writes to 0x00-0x03 preset the counter (P/L=0) or the comparator
+      (P/L=1)
+    - command register 0x06: CC1 latches the counter into 0x00-0x03,
+      CC0+CC1 resets the counter
+    - mode (0x04) reads back, board ID at bar1 0x0f
+    """
+    model = 6204
+    bar_sizes = (0x20, 0x10)
+
+    def reset(self):
+        self.counters = [0, 0]
+        self.comparators = [0, 0]
+        self.regs_in[1][0x0f] = self.board_id & 0x0f
+        return
+
+    def count(self, pulses, ch=1):
+        """Advance the counter of `ch` by `pulses` (may be negative)."""
+        c = (self.counters[ch-1] + pulses) & 0xffffffff
+        if c & 0x80000000:
+            c -= 0x100000000
+            pass
+        self.counters[ch-1] = c
+        return
+
+    def on_write(self, bar_num, offset, size):
+        if bar_num != 0:
+            return
+
+        for ch in (1, 2):
+            base = (ch - 1) * 0x10
+            if (offset < base + 0x10) and (base < offset + size):
+                self._write_channel(ch, base, offset - base, size)
+                pass
+            continue
+        return
+
+    def _write_channel(self, ch, base, start, size):
+        out = self.regs_out[0]
+        touched = range(max(start, 0), min(start + size, 0x10))
+
+        if any(r < 0x04 for r in touched):
+            value = int.from_bytes(out[base:base+4], 'little', signed=True)
+            if out[base+0x05] & 0x01:
+                self.comparators[ch-1] = value
+            else:
+                self.counters[ch-1] = value
+                pass
+            pass
+
+        if 0x04 in touched:
+            self.regs_in[0][base+0x04] = out[base+0x04]
+            pass
+
+        if 0x06 in touched:
+            cc = out[base+0x06] & 0x03
+            if cc == 0x03:
+                self.counters[ch-1] = 0
+            elif cc == 0x02:
+                c = self.counters[ch-1] & 0xffffffff
+                self.regs_in[0][base:base+4] = c.to_bytes(4, 'little')
+                pass
+            pass
+        return
+
+
+class sim_ppmc(object):
+    """Pulse-motor controller (PPMC) behind the data/command ports of a
+    PCI-7204 axis. Moves complete immediately; continuous moves stay busy
+    until a stop command."""
+
+    status_obf = 0x01
+    status_busy = 0x04
+
+    # command -> number of data bytes that follow it
+    data_length = {0x43: 3, 0x45: 1, 0x83: 3, 0x85: 2, 0x89: 2}
+
+    def __init__(self):
+        self.out = collections.deque()
+        self.counter = 0
+        self.busy = False
+        self.error = 0
+        self.stop_status = 0
+        self.limit_status = 0
+        self.aux_in = 0
+        self.aux_out = 0
+        self.params = b''
+        self.speed = 0
+        self._cmd = None
+        self._args = bytearray()
+        self._nargs = 0
+        pass
+
+    def status(self):
+        st = 0
+        if self.out: st |= self.status_obf
+        if self.busy: st |= self.status_busy
+        return st
+
+    def data(self):
+        if self.out:
+            return self.out[0]
+        return 0
+
+    def pop(self):
+        if self.out:
+            self.out.popleft()
+            pass
+        return
+
+    def command(self, cmd):
+        self._cmd = cmd
+        self._args = bytearray()
+
+        if cmd < 0x40:
+            self._nargs = 6
+            return
+
+        base = cmd & ~0x20 if cmd >= 0x80 else cmd
+        self._nargs = self.data_length.get(base, 0)
+        if self._nargs == 0:
+            self._execute()
+            pass
+        return
+
+    def write_data(self, d):
+        if self._cmd is None:
+            return
+        self._args.append(d)
+        if len(self._args) >= self._nargs:
+            self._execute()
+            pass
+        return
+
+    def _execute(self):
+        cmd = self._cmd
+        args = int.from_bytes(self._args, 'little')
+        self._cmd = None
+
+        if cmd < 0x40:
+            self.params = bytes(self._args)
+            return
+
+        if cmd == 0x40: self.out.append(self.stop_status)
+        elif cmd == 0x41: self.out.append(self.error)
+        elif cmd == 0x42: self.out.extend(self.counter.to_bytes(3, 'little'))
+        elif cmd == 0x43: self.counter = args & 0xffffff
+        elif cmd == 0x44: self.out.append(self.aux_in)
+        elif cmd == 0x45: self.aux_out = args & 0xff
+        elif cmd == 0x46: self.out.append(self.limit_status)
+        elif cmd >= 0x80:
+            direction = -1 if cmd & 0x20 else 1
+            base = cmd & ~0x20
+            if base in (0x80, 0x81):
+                self.busy = False
+            elif base == 0x82:
+                self.counter = (self.counter + direction) & 0xffffff
+            elif base == 0x83:
+                self.counter = (self.counter + direction * args) & 0xffffff
+            elif base == 0x85:
+                self.speed = args
+                self.busy = True
+            elif base == 0x89:
+                self.speed = args
+                pass
+            pass
+        return
+
+
+class sim_pci7204(sim_board):
+    """PCI-7204: two PPMC axes (bar1, bar2) with data (0x00) and
+    status/command (0x01) ports. Limit configuration registers read back;
+    interlock at bar0 0x05, board ID at bar0 0x07."""
+    model = 7204
+    bar_sizes = (0x08, 0x10, 0x10)
+
+    def reset(self):
+        self.ppmc = [sim_ppmc(), sim_ppmc()]
+        self.regs_in[0][0x07] = self.board_id & 0x0f
+        self._refresh(1)
+        self._refresh(2)
+        return
+
+    def _refresh(self, bar_num):
+        p = self.ppmc[bar_num-1]
+        self.regs_in[bar_num][0x00] = p.data()
+        self.regs_in[bar_num][0x01] = p.status()
+        return
+
+    def on_read(self, bar_num, offset, size):
+        if bar_num in (1, 2) and offset == 0x00:
+            self.ppmc[bar_num-1].pop()
+            self._refresh(bar_num)
+            pass
+        return
+
+    def on_write(self, bar_num, offset, size):
+        if bar_num not in (1, 2):
+            return
+
+        p = self.ppmc[bar_num-1]
+        out = self.regs_out[bar_num]
+        for o in range(offset, offset + size):
+            if o == 0x00: p.write_data(out[0x00])
+            elif o == 0x01: p.command(out[0x01])
+            elif 0x08 <= o <= 0x0e: self.regs_in[bar_num][o] = out[o]
+            continue
+
+        self._refresh(bar_num)
+        return
+
+
+# model -> simulated board class
+sim_boards = {
+    2702: sim_pci2702,
+    2724: sim_pci2724,
+    6204: sim_pci6204,
+    7204: sim_pci7204,
+}
+
+
+class simulated_backend(backend):
+    """Backend serving register accesses from simulated boards."""
+
+    def __init__(self, boards=()):
+        self.boards = list(boards)
+        pass
+
+    def add_board(self, board):
+        self.boards.append(board)
+        return board
+
+    def read(self, bar, offset, size):
+        return bar.board.read(bar.index, offset, size)
+
+    def write(self, bar, offset, data):
+        bar.board.write(bar.index, offset, data)
+        return
+
+    def read_into(self, bar, offset, buf):
+        buf[:] = bar.board.read(bar.index, offset, len(buf))
+        return
+
+    def lspci(self, vendor_id, device_id):
+        return [b.config for b in self.boards
+                if (vendor_id == interface_vendor_id)
+                and (b.model == device_id)]
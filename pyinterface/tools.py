@@ -1,51 +1,107 @@
 
-import pypci
-
-from . import pci2702
-from . import pci2724
-from . import pci6204
-from . import pci7204
+from .backend import get_default_backend
+from .registry import get_driver_class, has_driver, get_models
+from . import discovery
 
 
 interface_vendor_id = 0x1147
 
 
-def open(board_name, board_id):    
-    if type(board_id) == int:
-        board_id = format(board_id, '1X')
+def open(board_name, board_id, backend=None):    
+    if type(board_id) == str:
+        board_id = int(board_id, 16)
+        pass
+    if backend is None:
+        backend = get_default_backend()
         pass
-    
-    board_list = pypci.lspci(interface_vendor_id, board_name)
-    
-    if board_list == []:
+    if not has_driver(board_name):
+        if backend.lspci(interface_vendor_id, board_name) == []:
+            msg = 'board_id {0} is not found'.format(board_name)
+            raise TypeError(msg)
+        return
+    index = discovery.get_index(backend)
+    if index.boards(board_name) == {}:
         msg = 'board_id {0} is not found'.format(board_name)
         raise TypeError(msg)
-    
-    for board in board_list:
-        if board_name == 2702:
-            b = pci2702.pci2702_driver(board)
-            if b.board_id == board_id:
-                return b
-            pass
-        
-        if board_name == 2724:
-            b = pci2724.pci2724_driver(board)
-            if b.board_id == board_id:
-                return b
-            pass
-        
-        if board_name == 6204:
-            b = pci6204.pci6204_driver(board)
-            if b.board_id == board_id:
-                return b
-            pass
-
-
-        if board_name == 7204:
-            b = pci7204.pci7204_driver(board)
-            if b.board_id == board_id:
-                return b
-            pass
-
-        continue
-    
+    config = index.find(board_name, board_id)
+    if config is None and index.from_cache(board_name):
+        # the ID may be missing from a stale cache entry; scan again
+        index.invalidate(board_name)
+        config = index.find(board_name, board_id)
+        pass
+    if config is None:
+        return
+    b = get_driver_class(board_name)(config, backend)
+    if int(b.board_id, 16) != board_id:
+        # stale cache entry (board ID switch changed); scan again
+        index.invalidate(board_name)
+        config = index.find(board_name, board_id)
+        if config is None:
+            return
+        b = get_driver_class(board_name)(config, backend)
+        pass
+    return b
+
+def open_all(backend=None, models=None, max_workers=None):
+    """Open every Interface board found on the bus.
+
+    lspci() runs once per model (see discovery); each board ID is read
+    by the scan and again by the driver, and a model whose cached IDs do
+    not match the drivers (board ID switch changed) is scanned again, as
+    in open(). Drivers are built in a thread pool when the backend is
+    thread safe.
+
+    Parameters
+    ----------
+    backend : backend, optional
+    models : iterable of int, optional
+        Board models to look for (default: all registered models).
+    max_workers : int, optional
+        Size of the thread pool.
+
+    Returns
+    -------
+    dict
+        {(model, board_id): driver}, board_id as int.
+    """
+    if backend is None:
+        backend = get_default_backend()
+        pass
+    if models is None:
+        models = get_models()
+        pass
+
+    index = discovery.get_index(backend)
+
+    def get_jobs(models):
+        jobs = []
+        for model in models:
+            driver = get_driver_class(model)
+            for board_id, config in sorted(index.boards(model).items()):
+                jobs.append(((model, board_id), driver, config))
+                continue
+            continue
+        return jobs
+
+    def build(job):
+        key, driver, config = job
+        return key, driver(config, backend)
+
+    def build_all(jobs):
+        if backend.thread_safe and len(jobs) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers) as executor:
+                return list(executor.map(build, jobs))
+        return [build(job) for job in jobs]
+
+    built = build_all(get_jobs(models))
+    stale = {key[0] for key, b in built if int(b.board_id, 16) != key[1]}
+    if stale:
+        # stale cache entries (board ID switch changed); scan again
+        for model in stale:
+            index.invalidate(model)
+            continue
+        built = [(key, b) for key, b in built if key[0] not in stale]
+        built += build_all(get_jobs(sorted(stale)))
+        pass
+    return dict(built)
@@ -0,0 +1,183 @@
+"""
+Register access tracer.
+
+register_tracer keeps the most recent register accesses of a driver in a
+fixed-size ring buffer of preallocated arrays (one array per field), so
+recording an access does not allocate Python objects. Attach it with
+interface_driver.enable_trace().
+
+Fields of a record:
+
+- timestamp : time.monotonic_ns() at the start of the access
+- elapsed : duration of the access [ns]
+- direction : 0 = read, 1 = write
+- bar, offset, size
+- data : the first 8 bytes of the access as a little-endian uint64
+
+Traces are saved in a compact binary format (save() / load_trace()):
+a 24-byte header (magic, version, record count) followed by each field
+as a little-endian column, oldest record first.
+"""
+
+import array
+import struct
+import sys
+import threading
+
+_numpy = None
+
+def _find_numpy():
+    """Import numpy on first use; False if it is not installed."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+            pass
+        pass
+    return _numpy
+
+
+magic = b'PYIFTRC\x00'
+version = 1
+
+_header = struct.Struct('<8sIIQ')
+
+# (name, array typecode, numpy dtype)
+fields = (
+    ('timestamp', 'q', '<i8'),
+    ('elapsed', 'Q', '<u8'),
+    ('direction', 'B', 'u1'),
+    ('bar', 'B', 'u1'),
+    ('offset', 'H', '<u2'),
+    ('size', 'H', '<u2'),
+    ('data', 'Q', '<u8'),
+)
+
+
+class InvalidTraceFileError(Exception):
+    pass
+
+
+class register_tracer(object):
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.arrays = {name: array.array(code, bytes(capacity * array.array(code).itemsize))
+                       for name, code, _ in fields}
+        self.timestamp = self.arrays['timestamp']
+        self.elapsed = self.arrays['elapsed']
+        self.direction = self.arrays['direction']
+        self.bar = self.arrays['bar']
+        self.offset = self.arrays['offset']
+        self.size = self.arrays['size']
+        self.data = self.arrays['data']
+        self.count = 0
+        # record() is called under the lock of the accessed bar; accesses
+        # to different bars may record concurrently
+        self._lock = threading.Lock()
+        pass
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self.count = 0
+        return
+
+    def record(self, kind, bar_num, offset, data, t0_ns, elapsed_ns):
+        value = int.from_bytes(data[:8], 'little')
+        with self._lock:
+            i = self.count % self.capacity
+            self.timestamp[i] = t0_ns
+            self.elapsed[i] = elapsed_ns
+            self.direction[i] = kind
+            self.bar[i] = bar_num
+            self.offset[i] = offset
+            self.size[i] = len(data)
+            self.data[i] = value
+            self.count += 1
+            pass
+        return
+
+    def to_arrays(self):
+        """Return {field: array} of the buffered records, oldest first.
+
+        numpy arrays are returned when numpy is available, array.array
+        otherwise.
+        """
+        n = len(self)
+        start = self.count % self.capacity if self.count > self.capacity else 0
+
+        numpy = _find_numpy()
+        ret = {}
+        for name, code, dtype in fields:
+            a = self.arrays[name]
+            ordered = a[start:n] + a[:start]
+            if numpy:
+                ordered = numpy.frombuffer(ordered, dtype=numpy.dtype(code)).copy()
+                pass
+            ret[name] = ordered
+            continue
+        return ret
+
+    def save(self, path):
+        n = len(self)
+        start = self.count % self.capacity if self.count > self.capacity else 0
+
+        with open(path, 'wb') as f:
+            f.write(_header.pack(magic, version, 0, n))
+            for name, code, _ in fields:
+                a = self.arrays[name]
+                ordered = a[start:n] + a[:start]
+                if sys.byteorder == 'big':
+                    ordered.byteswap()
+                    pass
+                f.write(ordered.tobytes())
+                continue
+            pass
+        return
+
+
+def load_trace(path):
+    """Load a trace written by register_tracer.save().
+
+    Returns
+    -------
+    dict
+        {field: array} (numpy arrays when numpy is available)
+    """
+    with open(path, 'rb') as f:
+        head = f.read(_header.size)
+        if len(head) != _header.size:
+            raise InvalidTraceFileError('{0} is too short'.format(path))
+
+        mg, ver, _, n = _header.unpack(head)
+        if mg != magic:
+            raise InvalidTraceFileError('{0} is not a trace file'.format(path))
+        if ver != version:
+            msg = 'trace version {0} is not supported'.format(ver)
+            raise InvalidTraceFileError(msg)
+
+        numpy = _find_numpy()
+        ret = {}
+        for name, code, dtype in fields:
+            itemsize = array.array(code).itemsize
+            raw = f.read(n * itemsize)
+            if len(raw) != n * itemsize:
+                raise InvalidTraceFileError('{0} is truncated'.format(path))
+
+            if numpy:
+                ret[name] = numpy.frombuffer(raw, dtype=dtype).copy()
+            else:
+                a = array.array(code)
+                a.frombytes(raw)
+                if sys.byteorder == 'big':
+                    a.byteswap()
+                    pass
+                ret[name] = a
+                pass
+            continue
+        pass
+    return ret
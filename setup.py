@@ -15,6 +15,15 @@ setuptools.setup(
         'pyinterface',
     ],
     install_requires = ['portio'],
+    extras_require = {
+        # pyinterface.sampler; numpy paths of core and trace
+        'numpy': ['numpy'],
+    },
+    entry_points = {
+        'console_scripts': [
+            'pyinterface-server = pyinterface.server:main',
+        ],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'License :: OSI Approved :: MIT License',
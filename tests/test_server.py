@@ -0,0 +1,84 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pyinterface.client import RemoteAccessError, remote_backend
+from pyinterface.server import board_server
+from pyinterface.simulator import simulated_backend, sim_pci2724
+from pyinterface.tools import open as open_board
+
+
+class server_test(unittest.TestCase):
+
+    def setUp(self):
+        sim = simulated_backend()
+        self.board = sim_pci2724()
+        sim.add_board(self.board)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.sock')
+        self.server = board_server([open_board(2724, 0, backend=sim)],
+                                   self.path)
+
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        async def serve():
+            await self.server.start()
+            ready.set()
+            while self.server._server is not None:
+                await asyncio.sleep(0.01)
+                continue
+            await asyncio.gather(self.server._dispatcher,
+                                 return_exceptions=True)
+            return
+
+        self.thread = threading.Thread(target=self.loop.run_until_complete,
+                                       args=(serve(),))
+        self.thread.start()
+        ready.wait()
+        self.backends = []
+        pass
+
+    def tearDown(self):
+        for rb in self.backends:
+            rb.close()
+            continue
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.thread.join()
+        self.loop.close()
+        shutil.rmtree(self.dir)
+        pass
+
+    def client(self):
+        rb = remote_backend(self.path)
+        self.backends.append(rb)
+        return open_board(2724, 0, backend=rb)
+
+    def test_write_elision_sees_other_clients(self):
+        a = self.client()
+        b = self.client()
+        a.enable_write_elision()
+
+        a.output_dword_raw(0x3)
+        self.assertEqual(self.board.get_outputs(), 0x3)
+        b.clear_bits(0x3)
+        self.assertEqual(self.board.get_outputs(), 0x0)
+        a.output_dword_raw(0x3)
+        self.assertEqual(self.board.get_outputs(), 0x3)
+        self.assertEqual(a.elided_writes, 0)
+        pass
+
+    def test_access_out_of_bar(self):
+        a = self.client()
+        with self.assertRaises(RemoteAccessError) as cm:
+            a.read(0, 0x0f, 2)
+            pass
+        self.assertIn('out of bar0', str(cm.exception))
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()